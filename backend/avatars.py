@@ -0,0 +1,161 @@
+# avatars.py
+import os
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Размеры аватаров (квадрат, px) и качество WebP
+AVATAR_SIZES = (64, 256)
+AVATAR_MAIN_SIZE = 256
+WEBP_QUALITY = 80
+MAX_AVATAR_BYTES = int(os.getenv("MAX_AVATAR_BYTES", str(5 * 1024 * 1024)))
+READ_CHUNK = 64 * 1024
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class AvatarTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Пул процессов для ресайза (Pillow держит GIL и грузит CPU)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=int(os.getenv("AVATAR_WORKERS", "2")))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def avatar_filename(digest: str, size: int) -> str:
+    return f"{digest}_{size}.webp"
+
+
+async def read_upload(upload, limit: int = MAX_AVATAR_BYTES):
+    """Читает UploadFile кусками, считая sha256 на лету; обрывает чтение после limit байт"""
+    sha = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit:
+            raise AvatarTooLarge()
+        sha.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), sha.hexdigest()
+
+
+# Запас на границы и заголовки multipart поверх самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """Обрывает слишком большое тело запроса до разбора multipart: по Content-Length сразу,
+    без него (chunked) - как только прочитано больше лимита. read_upload проверяет уже сам файл"""
+
+    def __init__(self, app, paths: tuple = ("/upload-avatar",),
+                 limit: int = MAX_AVATAR_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = paths
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.limit:
+            await self.reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    exceeded = True
+                    raise AvatarTooLarge()
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if exceeded:
+                # FastAPI превращает ошибку чтения тела в 400 - отвечаем 413 вместо этого ответа
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self.reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_wrapper)
+        except AvatarTooLarge:
+            if response_started:
+                raise
+            await self.reject(send)
+
+    async def reject(self, send):
+        body = f'{{"detail":"Файл больше {MAX_AVATAR_BYTES // (1024 * 1024)} МБ"}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def render_avatar(data: bytes, digest: str, avatar_dir: str):
+    """Выполняется в дочернем процессе: центрированный квадрат -> WebP всех размеров"""
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except Exception as e:
+        raise InvalidImage(str(e))
+
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    for size in AVATAR_SIZES:
+        path = os.path.join(avatar_dir, avatar_filename(digest, size))
+        thumb = ImageOps.fit(image, (size, size), method=Image.LANCZOS)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        thumb.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp_path, path)
+
+
+async def store_avatar(data: bytes, digest: str, avatar_dir: str) -> dict:
+    """Сохраняет аватар по хэшу содержимого; одинаковые файлы обрабатываются один раз"""
+    paths = [os.path.join(avatar_dir, avatar_filename(digest, size)) for size in AVATAR_SIZES]
+    if not all(os.path.exists(path) for path in paths):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_executor(), render_avatar, data, digest, avatar_dir)
+    return {size: avatar_filename(digest, size) for size in AVATAR_SIZES}
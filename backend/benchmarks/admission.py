@@ -0,0 +1,181 @@
+"""
+Ограничение нагрузки (ratelimit.py): шторм записей против чтений на маленьком пуле.
+
+Писатели почти без пауз шлют /messages/send (клиент, повторяющий запросы в цикле),
+читатели в это же время запрашивают /stats. Один и тот же сценарий прогоняется
+с выключенными и включенными лимитами; сравниваются задержки читателей, ожидание
+и таймауты пула, а также доли 200/429/503 у писателей. Отдельно - CPU на одно
+решение лимитера (token bucket в памяти + слот конкурентности).
+
+Запуск из каталога backend:
+    python benchmarks/admission.py
+    python benchmarks/admission.py --writers 40 --readers 10 --duration 5 --pool-size 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+async def seed(client, couples: int) -> list:
+    """Заголовки авторизации пользователей, каждый в своей паре"""
+    headers = []
+    for i in range(couples * 2):
+        email = f"user{i}@example.com"
+        await client.post("/register", json={
+            "email": email, "username": f"user{i}", "password": "password", "gender": "male"
+        })
+        r = await client.post("/login", json={"username": email, "password": "password"})
+        headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+    for first, second in zip(headers[::2], headers[1::2]):
+        r = await client.post("/couples/create", data={"couple_name": "Пара"}, headers=first)
+        await client.post("/couples/join", data={"couple_code": r.json()["couple_code"]}, headers=second)
+    # Токены с couple_id
+    for i in range(len(headers)):
+        r = await client.post("/login", json={"username": f"user{i}@example.com", "password": "password"})
+        headers[i] = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    return headers
+
+
+async def run_mode(client, headers: list, args, enabled: bool) -> dict:
+    import ratelimit
+    from database import async_pool_metrics
+
+    ratelimit.RATE_LIMIT_ENABLED = enabled
+    # Свежие bucket'ы: второй прогон не должен наследовать списанные токены первого
+    ratelimit.bucket_backend._buckets.clear()
+    pool = async_pool_metrics
+    wait_before = (pool.wait.count, pool.wait.sum, pool.timeouts)
+
+    statuses = {}
+    read_latencies = []
+    read_errors = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def writer(h):
+        while time.perf_counter() < deadline:
+            try:
+                r = await client.post("/messages/send", json={"message": "♥"}, headers=h)
+                code = r.status_code
+            except Exception:
+                code = "error"
+            statuses[code] = statuses.get(code, 0) + 1
+            await asyncio.sleep(args.write_pause)
+
+    async def reader(h):
+        nonlocal read_errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                r = await client.get("/stats", headers=h)
+                ok = r.status_code == 200
+            except Exception:
+                ok = False
+            if ok:
+                read_latencies.append(time.perf_counter() - started)
+            else:
+                read_errors += 1
+            await asyncio.sleep(args.read_pause)
+
+    await asyncio.gather(
+        *(writer(headers[i % len(headers)]) for i in range(args.writers)),
+        *(reader(headers[i % len(headers)]) for i in range(args.readers)),
+    )
+
+    waits = pool.wait.count - wait_before[0]
+    return {
+        "limits": enabled,
+        "writes": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+        "reads": len(read_latencies),
+        "read_errors": read_errors,
+        "read_latency_ms": {
+            "p50": round(percentile(read_latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(read_latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(read_latencies, 0.99) * 1000, 2),
+        },
+        "pool_wait_ms_mean": round((pool.wait.sum - wait_before[1]) / waits * 1000, 2) if waits else 0.0,
+        "pool_timeouts": pool.timeouts - wait_before[2],
+    }
+
+
+async def decision_overhead(iterations: int) -> float:
+    """CPU мкс на admit + release (разные ключи, bucket в памяти)"""
+    import ratelimit
+
+    rate_limiter = ratelimit.RateLimiter("bench", f"{iterations}/1", ratelimit.MemoryBucketBackend())
+    concurrency_limiter = ratelimit.ConcurrencyLimiter("bench", 1)
+    started = time.process_time()
+    for i in range(iterations):
+        slot = await ratelimit.admit(rate_limiter, f"user:{i % 1000}", concurrency_limiter)
+        slot.release()
+    return (time.process_time() - started) / iterations * 1_000_000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--couples", type=int, default=10)
+    parser.add_argument("--writers", type=int, default=30, help="одновременных клиентов /messages/send")
+    parser.add_argument("--readers", type=int, default=5, help="одновременных клиентов /stats")
+    parser.add_argument("--write-pause", type=float, default=0.005,
+                        help="пауза писателя между запросами, с (Retry-After игнорируется)")
+    parser.add_argument("--read-pause", type=float, default=0.01, help="пауза читателя между запросами, с")
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--pool-size", type=int, default=3)
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--pool-timeout", type=float, default=2)
+    parser.add_argument("--writes-limit", type=int, default=2, help="CONCURRENCY_LIMIT_WRITES")
+    parser.add_argument("--iterations", type=int, default=100000, help="для замера CPU на решение")
+    parser.add_argument("--output", help="записать результаты в JSON файл")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте database.py и ratelimit.py
+    os.environ.pop("DATABASE_URL", None)
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(args.max_overflow)
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+    os.environ["CONCURRENCY_LIMIT_WRITES"] = str(args.writes_limit)
+    os.chdir(tempfile.mkdtemp(prefix="loveapp-admission-"))
+
+    import httpx
+    import ratelimit
+    from main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        ratelimit.RATE_LIMIT_ENABLED = False
+        headers = await seed(client, args.couples)
+        for enabled in (False, True):
+            result = await run_mode(client, headers, args, enabled)
+            results.append(result)
+            print(
+                f"limits={'on ' if enabled else 'off'}  writes={result['writes']}  "
+                f"reads={result['reads']} (ошибок {result['read_errors']})  "
+                f"p50={result['read_latency_ms']['p50']} ms  p95={result['read_latency_ms']['p95']} ms  "
+                f"ожидание пула={result['pool_wait_ms_mean']} ms  таймауты={result['pool_timeouts']}"
+            )
+
+    overhead = await decision_overhead(args.iterations)
+    print(f"CPU на решение лимитера: {overhead:.2f} мкс")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"modes": results, "decision_cpu_us": round(overhead, 3)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
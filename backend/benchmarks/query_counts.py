@@ -0,0 +1,89 @@
+"""
+Проверка количества SQL запросов на эндпоинт (защита от N+1).
+
+Запуск из каталога backend:
+    python benchmarks/query_counts.py --messages 200 --tests 20
+
+Завершается с кодом 1, если какой-либо эндпоинт превысил бюджет запросов.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# Отдельная SQLite база во временном каталоге, чтобы не трогать ./test.db
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.pop("DATABASE_URL", None)
+os.environ["RATE_LIMIT_ENABLED"] = "false"  # Сотни запросов от одного пользователя подряд
+os.chdir(tempfile.mkdtemp(prefix="loveapp-queries-"))
+
+import httpx  # noqa: E402
+
+from main import app  # noqa: E402
+from database import count_queries  # noqa: E402
+
+# Максимум запросов на один вызов (пользователь и пара уже в кэше)
+QUERY_BUDGET = {
+    "/profile": 0,
+    "/messages": 1,
+    "/tests/results": 2,
+    "/stats": 1,
+    "/couples/my": 0,
+    "/dashboard": 3,
+}
+
+
+async def seed(client, messages: int, tests: int):
+    headers = []
+    for email, name in (("alice@example.com", "alice"), ("bob@example.com", "bob")):
+        await client.post("/register", json={
+            "email": email, "username": name, "password": "password", "gender": "male"
+        })
+        r = await client.post("/login", json={"username": email, "password": "password"})
+        headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+
+    r = await client.post("/couples/create", data={"couple_name": "Пара"}, headers=headers[0])
+    await client.post("/couples/join", data={"couple_code": r.json()["couple_code"]}, headers=headers[1])
+
+    for i in range(messages):
+        await client.post("/messages/send", json={"message": f"Сообщение {i}"}, headers=headers[i % 2])
+
+    answers = [{"question_id": 1, "answer_value": 3}, {"question_id": 2, "answer_value": 4}]
+    for _ in range(tests):
+        r = await client.post("/tests/start", data={"test_title": "Тест на совместимость"}, headers=headers[0])
+        test_id = r.json()["test_id"]
+        for h in headers:
+            await client.post(f"/tests/{test_id}/submit", json=answers, headers=h)
+
+    return headers[0]
+
+
+async def main(messages: int, tests: int) -> int:
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await seed(client, messages, tests)
+
+        failed = False
+        for path, budget in QUERY_BUDGET.items():
+            await client.get(path, headers=headers)  # прогрев кэшей
+            with count_queries() as statements:
+                r = await client.get(path, headers=headers)
+            status = "OK" if len(statements) <= budget else "FAIL"
+            failed = failed or status == "FAIL" or r.status_code != 200
+            print(f"{path:<16} status={r.status_code} queries={len(statements):<3} budget={budget:<3} {status}")
+            if status == "FAIL":
+                for statement in statements:
+                    print("    " + " ".join(statement.split())[:160])
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--tests", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.messages, args.tests)))
@@ -0,0 +1,120 @@
+"""
+Проверка checkpoint'а rescore.py: запуск с --only не должен ломать следующий полный прогон.
+
+Сценарий на временной SQLite базе:
+    1. rescore.py --only results пересчитывает только test_results и не оставляет checkpoint
+    2. checkpoint прерванного запуска --only results не мешает полному прогону:
+       пересчитываются и test_results, и shared_test_results
+
+Запуск из каталога backend:
+    python benchmarks/rescore_resume.py --tests 10
+
+Завершается с кодом 1, если какой-либо шаг не прошел.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.pop("DATABASE_URL", None)
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.chdir(tempfile.mkdtemp(prefix="loveapp-rescore-"))
+
+CHECKPOINT = "rescore.checkpoint.json"
+
+
+async def seed(tests: int):
+    import httpx
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = []
+        for email, name in (("alice@example.com", "alice"), ("bob@example.com", "bob")):
+            await client.post("/register", json={
+                "email": email, "username": name, "password": "password", "gender": "male"
+            })
+            r = await client.post("/login", json={"username": email, "password": "password"})
+            headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+
+        r = await client.post("/couples/create", data={"couple_name": "Пара"}, headers=headers[0])
+        await client.post("/couples/join", data={"couple_code": r.json()["couple_code"]}, headers=headers[1])
+
+        answers = [{"question_id": 1, "answer_value": 3}, {"question_id": 2, "answer_value": 4}]
+        for _ in range(tests):
+            r = await client.post("/tests/start", data={"test_title": "Тест на совместимость"}, headers=headers[0])
+            test_id = r.json()["test_id"]
+            for h in headers:
+                await client.post(f"/tests/{test_id}/submit", json=answers, headers=h)
+
+
+def corrupt(tables: tuple):
+    """Портит сохраненные баллы, чтобы было видно, какие фазы пересчитались"""
+    with sqlite3.connect("test.db") as conn:
+        if "results" in tables:
+            conn.execute("UPDATE test_results SET score = -1")
+        if "shared" in tables:
+            conn.execute("UPDATE shared_test_results SET compatibility_percentage = -1")
+
+
+def stale_rows() -> dict:
+    with sqlite3.connect("test.db") as conn:
+        return {
+            "results": conn.execute("SELECT count(*) FROM test_results WHERE score = -1").fetchone()[0],
+            "shared": conn.execute(
+                "SELECT count(*) FROM shared_test_results WHERE compatibility_percentage = -1"
+            ).fetchone()[0],
+        }
+
+
+def rescore(*args) -> bool:
+    completed = subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "rescore.py"), "--workers", "0", "--checkpoint", CHECKPOINT, *args],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        print(completed.stdout + completed.stderr)
+    return completed.returncode == 0
+
+
+def check(name: str, ok: bool, details) -> bool:
+    print(f"{name:<40} {details} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main(tests: int) -> int:
+    asyncio.run(seed(tests))
+    ok = True
+
+    corrupt(("results", "shared"))
+    ran = rescore("--only", "results")
+    stale = stale_rows()
+    ok &= check("--only results", ran and stale == {"results": 0, "shared": tests}, stale)
+    ok &= check("checkpoint после --only results", not os.path.exists(CHECKPOINT),
+                "есть" if os.path.exists(CHECKPOINT) else "нет")
+
+    # Запуск --only results прервался на середине, затем запускается полный пересчет
+    corrupt(("results", "shared"))
+    with open(CHECKPOINT, "w") as f:
+        json.dump({"phases": ["results"], "phase": "results", "last_id": 10 ** 9}, f)
+    ran = rescore()
+    stale = stale_rows()
+    ok &= check("полный прогон после --only results", ran and stale == {"results": 0, "shared": 0}, stale)
+    ok &= check("checkpoint после полного прогона", not os.path.exists(CHECKPOINT),
+                "есть" if os.path.exists(CHECKPOINT) else "нет")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(main(args.tests))
@@ -0,0 +1,64 @@
+"""
+Скорость подсчета результатов: по одному прохождению и пачкой через NumPy.
+
+Запуск из каталога backend:
+    python benchmarks/scoring_batch.py                 # 100k прохождений каждого теста каталога
+    python benchmarks/scoring_batch.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from catalog import test_catalog, content_hash  # noqa: E402
+from scoring import get_scorer  # noqa: E402
+
+
+def random_submissions(questions: list, rows: int) -> list:
+    return [
+        [
+            {"question_id": q["id"], "answer_value": random.choice(q["options"])["value"]}
+            for q in questions
+        ]
+        for _ in range(rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    test_catalog.load()
+    for test in test_catalog.tests:
+        scorer = get_scorer(content_hash(test), test["questions"], test.get("scoring"))
+        submissions = random_submissions(test["questions"], args.rows)
+        partners = random_submissions(test["questions"], args.rows)
+
+        started = time.perf_counter()
+        single = [scorer.score_one(answers)[0] for answers in submissions[:10_000]]
+        single_rate = len(single) / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        matrix = scorer.encode(submissions)
+        scores, _ = scorer.score(matrix)
+        partner_matrix = scorer.encode(partners)
+        partner_scores, _ = scorer.score(partner_matrix)
+        scorer.compatibility(matrix, partner_matrix, scores, partner_scores)
+        batch_rate = args.rows / (time.perf_counter() - started)
+
+        assert np.array_equal(scores[:len(single)], single)
+        print(
+            f"{test['slug']:<16} model={scorer.model:<12} "
+            f"по одному={single_rate:>10,.0f}/с  пачкой={batch_rate:>10,.0f}/с (с совместимостью)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+CPU на запрос для горячих эндпоинтов: прежняя сериализация (jsonable_encoder + json,
+валидация response_model) против быстрого пути (orjson, без повторной валидации).
+
+Оба режима переключаются флагом serialization.FAST_JSON в одном процессе и
+проверяются на одинаковость ответов. Время - process_time (CPU процесса, включая
+SQLite), поэтому разница между режимами - это сэкономленный CPU на запрос.
+Отдельно выводятся размеры тела /messages со сжатием gzip и br.
+
+Запуск из каталога backend:
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --messages 500 --limit 100 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Отдельная SQLite база во временном каталоге, чтобы не трогать ./test.db
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.pop("DATABASE_URL", None)
+os.environ["RATE_LIMIT_ENABLED"] = "false"  # Сотни запросов от одного пользователя подряд
+os.chdir(tempfile.mkdtemp(prefix="loveapp-serialization-"))
+
+import httpx  # noqa: E402
+
+import serialization  # noqa: E402
+from compression import compress, brotli  # noqa: E402
+from main import app  # noqa: E402
+
+
+async def seed(client, messages: int, tests: int) -> dict:
+    headers = []
+    for email, name in (("alice@example.com", "alice"), ("bob@example.com", "bob")):
+        await client.post("/register", json={
+            "email": email, "username": name, "password": "password", "gender": "male"
+        })
+        r = await client.post("/login", json={"username": email, "password": "password"})
+        headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+
+    r = await client.post("/couples/create", data={"couple_name": "Пара"}, headers=headers[0])
+    await client.post("/couples/join", data={"couple_code": r.json()["couple_code"]}, headers=headers[1])
+
+    for i in range(messages):
+        await client.post("/messages/send", json={"message": f"Сообщение {i} " + "♥" * 40}, headers=headers[i % 2])
+
+    answers = [{"question_id": 1, "answer_value": 3}, {"question_id": 2, "answer_value": 4}]
+    for _ in range(tests):
+        r = await client.post("/tests/start", data={"test_title": "Тест на совместимость"}, headers=headers[0])
+        test_id = r.json()["test_id"]
+        for h in headers:
+            await client.post(f"/tests/{test_id}/submit", json=answers, headers=h)
+
+    # Токен пользователя, уже состоящего в паре (claims с couple_id)
+    r = await client.post("/login", json={"username": "alice@example.com", "password": "password"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}", "Accept-Encoding": "identity"}
+
+
+async def measure(client, path: str, headers: dict, requests: int) -> tuple:
+    """(CPU мкс на запрос, тело последнего ответа)"""
+    for _ in range(20):
+        r = await client.get(path, headers=headers)  # прогрев
+    started = time.process_time()
+    for _ in range(requests):
+        r = await client.get(path, headers=headers)
+    elapsed = time.process_time() - started
+    assert r.status_code == 200, r.text
+    return elapsed / requests * 1_000_000, r.content
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--tests", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50, help="?limit= для /messages")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--output", help="записать результаты в JSON файл")
+    args = parser.parse_args()
+
+    paths = (f"/messages?limit={args.limit}", "/tests/results", "/profile")
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await seed(client, args.messages, args.tests)
+
+        for path in paths:
+            timings, bodies = {}, {}
+            for mode, fast in (("legacy", False), ("fast", True)):
+                serialization.FAST_JSON = fast
+                timings[mode], bodies[mode] = await measure(client, path, headers, args.requests)
+            if json.loads(bodies["legacy"]) != json.loads(bodies["fast"]):
+                raise SystemExit(f"{path}: ответы в режимах legacy и fast различаются")
+
+            saved = timings["legacy"] - timings["fast"]
+            results.append({
+                "path": path,
+                "body_bytes": len(bodies["fast"]),
+                "cpu_us_per_request": {mode: round(value, 1) for mode, value in timings.items()},
+                "cpu_us_saved": round(saved, 1),
+                "saved_percent": round(saved / timings["legacy"] * 100, 1),
+            })
+            print(
+                f"{path:<22} legacy={timings['legacy']:>8.1f} мкс  fast={timings['fast']:>8.1f} мкс  "
+                f"сэкономлено={saved:>7.1f} мкс ({saved / timings['legacy'] * 100:.1f}%)  "
+                f"тело={len(bodies['fast'])} Б"
+            )
+
+        r = await client.get(paths[0], headers=headers)
+        body = r.content
+        sizes = {"identity": len(body), "gzip": len(compress(body, "gzip"))}
+        if brotli is not None:
+            sizes["br"] = len(compress(body, "br"))
+        print(f"{paths[0]} сжатие: " + ", ".join(f"{name}={size} Б" for name, size in sizes.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"endpoints": results, "compression": sizes}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# cache.py
+import os
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class MemoryBackend:
+    """Локальный LRU кэш с TTL (в пределах одного воркера)"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class RedisBackend:
+    """Общий кэш для нескольких воркеров (значения хранятся в JSON)"""
+
+    def __init__(self, url: str, ttl: float = 60, prefix: str = "loveapp"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any):
+        await self.client.set(self._key(key), json.dumps(value), ex=max(int(self.ttl), 1))
+
+    async def delete(self, key: str):
+        await self.client.delete(self._key(key))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def make_backend(name: str, maxsize: int, ttl: float):
+    """Redis, если задан CACHE_REDIS_URL, иначе локальный кэш в памяти"""
+    redis_url = os.getenv("CACHE_REDIS_URL")
+    if redis_url:
+        return RedisBackend(redis_url, ttl=ttl, prefix=f"loveapp:{name}")
+    return MemoryBackend(maxsize=maxsize, ttl=ttl)
+
+
+class ObjectCache:
+    """Кэш с явной инвалидацией и счетчиками попаданий/промахов"""
+
+    def __init__(self, name: str, backend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key) -> Optional[Any]:
+        value = await self.backend.get(str(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value: Any):
+        await self.backend.set(str(key), value)
+
+    async def invalidate(self, key):
+        await self.backend.delete(str(key))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.backend.evictions,
+            "size": self.backend.size()
+        }
+
+
+# Кэш пользователей для get_current_user (ключ - user id)
+user_cache = ObjectCache(
+    "users",
+    make_backend(
+        "users",
+        maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("USER_CACHE_TTL", "60"))
+    )
+)
+
+# Готовый ответ /couples/my: {"body", "etag"} (ключ - couple id).
+# Инвалидируется в create/join/upload-avatar, TTL страхует от гонки с ними
+couple_cache = ObjectCache(
+    "couples",
+    make_backend(
+        "couples",
+        maxsize=int(os.getenv("COUPLE_CACHE_SIZE", "5000")),
+        ttl=float(os.getenv("COUPLE_CACHE_TTL", "300"))
+    )
+)
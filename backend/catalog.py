@@ -0,0 +1,141 @@
+# catalog.py
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+
+from schemas import TestCreate
+from scoring import Scorer, ScoringError
+
+CATALOG_DIR = os.getenv(
+    "TESTS_CATALOG_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests_catalog")
+)
+# Как часто (сек) воркер проверяет, изменились ли файлы каталога
+RELOAD_INTERVAL = float(os.getenv("TESTS_CATALOG_RELOAD_INTERVAL", "5"))
+CATALOG_EXTENSIONS = (".json", ".yaml", ".yml")
+# Поля определения, которые не отдаются в /tests/available
+SERVER_ONLY_FIELDS = ("scoring",)
+
+
+class CatalogError(Exception):
+    pass
+
+
+def content_hash(definition: dict) -> str:
+    """Хэш содержимого теста: одинаковый контент = одна строка test_versions"""
+    content = {key: definition.get(key) for key in ("title", "description", "category", "questions")}
+    return hashlib.sha256(
+        json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def read_definition(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        # PyYAML импортируется только если в каталоге есть YAML файлы
+        import yaml
+        return yaml.safe_load(f)
+
+
+class TestCatalog:
+    """Определения тестов из каталога: загружаются один раз, индексируются, JSON ответа готов заранее"""
+
+    def __init__(self, directory: str = CATALOG_DIR, reload_interval: float = RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.tests = []
+        self.by_id = {}
+        self.by_slug = {}
+        self.by_title = {}
+        self.by_hash = {}
+        self.body = b"[]"
+        self.etag = '""'
+        self._signature = None
+        self._checked_at = 0.0
+
+    def _files(self) -> list:
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(CATALOG_EXTENSIONS)
+        )
+
+    def _directory_signature(self) -> tuple:
+        return tuple(
+            (path, stat.st_mtime_ns, stat.st_size)
+            for path, stat in ((path, os.stat(path)) for path in self._files())
+        )
+
+    def load(self):
+        """Полная загрузка каталога; при ошибке текущее состояние не меняется"""
+        signature = self._directory_signature()
+        tests = []
+        for path, _, _ in signature:
+            definition = read_definition(path)
+            try:
+                TestCreate(**definition)
+            except Exception as e:
+                raise CatalogError(f"{path}: {e}")
+            for key in ("id", "slug"):
+                if key not in definition:
+                    raise CatalogError(f"{path}: нет поля {key}")
+            try:
+                # Без compile: NumPy загрузится при первом подсчете, а не при старте
+                Scorer(definition["questions"], definition.get("scoring"), compile=False)
+            except (ScoringError, KeyError, TypeError, ValueError) as e:
+                raise CatalogError(f"{path}: некорректный scoring: {e}")
+            tests.append(definition)
+        tests.sort(key=lambda t: t["id"])
+
+        by_id = {t["id"]: t for t in tests}
+        by_slug = {t["slug"]: t for t in tests}
+        if len(by_id) != len(tests) or len(by_slug) != len(tests):
+            raise CatalogError("id и slug тестов должны быть уникальны")
+
+        # Клиентам - без scoring: веса и пороги остаются на сервере, а правка только
+        # подсчета не меняет ETag /tests/available
+        public = [{key: value for key, value in t.items() if key not in SERVER_ONLY_FIELDS} for t in tests]
+        body = json.dumps(public, ensure_ascii=False, separators=(",", ":")).encode()
+        self.tests = tests
+        self.by_id = by_id
+        self.by_slug = by_slug
+        self.by_title = {t["title"]: t for t in tests}
+        self.by_hash = {content_hash(t): t for t in tests}
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._signature = signature
+        self._checked_at = time.monotonic()
+
+    def refresh(self):
+        """Перечитывает каталог, если файлы изменились (не чаще раза в reload_interval)"""
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if self._directory_signature() != self._signature:
+                self.load()
+                print(f"✅ Каталог тестов перезагружен: {len(self.tests)} тестов")
+        except (OSError, ValueError, CatalogError) as e:
+            if not self.tests:
+                raise
+            print(f"⚠️ Каталог тестов не перезагружен, используется предыдущая версия: {e}")
+
+    def find(self, key) -> Optional[dict]:
+        """Тест по id, slug или названию"""
+        self.refresh()
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            return self.by_id.get(int(key))
+        return self.by_slug.get(key) or self.by_title.get(key)
+
+    def scoring_for(self, catalog_id: Optional[int], version_hash: str) -> Optional[dict]:
+        """Модель подсчета для версии теста (по id каталога или по содержимому)"""
+        self.refresh()
+        definition = self.by_id.get(catalog_id) or self.by_hash.get(version_hash)
+        return definition.get("scoring") if definition else None
+
+
+test_catalog = TestCatalog()
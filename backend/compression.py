@@ -0,0 +1,121 @@
+# compression.py
+import os
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Маленькие ответы не сжимаем: заголовки и CPU дороже выигрыша
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 4-5: быстро для динамических ответов
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/css", "image/svg+xml")
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """{"gzip": 1.0, "br": 0.5, ...} из Accept-Encoding"""
+    result = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[coding] = q
+    return result
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Лучшая поддерживаемая кодировка; при равном q предпочитаем br"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in (("br",) if brotli is not None else ()) + ("gzip",):
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").split(";")[0].strip()
+    return content_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    """gzip/br для ответов целиком в памяти больше COMPRESS_MIN_SIZE.
+    Потоковые ответы (SSE, файлы, Range) проходят без изменений"""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Заголовки отправляются вместе с первым куском тела, когда известен его размер
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            if not is_compressible(headers):
+                await send(start)
+                await send(message)
+                return
+            # Vary для любого сжимаемого ответа, даже несжатого: иначе кэш отдаст
+            # сохраненный вариант без сжатия (или со сжатием) всем клиентам
+            headers.add_vary_header("Accept-Encoding")
+            if (
+                encoding is None
+                or message.get("more_body")
+                or len(body) < self.minimum_size
+                or start["status"] in (204, 206, 304)
+            ):
+                await send({**start, "headers": headers.raw})
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Байты сжатого ответа отличаются от исходных: строгий ETag становится слабым.
+                # If-None-Match сравнивается слабо (media.etag_matches), поэтому 304 продолжает работать
+                headers["ETag"] = "W/" + etag
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
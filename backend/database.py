@@ -1,56 +1,330 @@
 # database.py
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import ssl
 
+from metrics import Histogram, record_query, render_histogram, registry
+from profiling import SQL_PROFILE, install as install_profiling
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
+# Настройки пула соединений (на каждый воркер uvicorn)
+# DB_POOL_MODE: queue - обычный пул; null/pgbouncer - без пула (соединения держит pgbouncer)
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+POOL_MODES = ("queue", "null", "pgbouncer")
+if DB_POOL_MODE not in POOL_MODES:
+    raise ValueError(f"DB_POOL_MODE должен быть одним из {POOL_MODES}")
+
+
+class PoolMetrics:
+    """Выданные соединения, overflow и время ожидания соединения из пула"""
+
+    def __init__(self):
+        self.wait = Histogram()
+        self.checked_out = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.pool = None
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        return {
+            "pool_class": type(pool).__name__ if pool else None,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": self.checked_out,
+            "idle": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            # QueuePool.overflow() отрицателен, пока пул не заполнен
+            "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else None,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait.snapshot(),
+        }
+
+
+class TimedPoolMixin:
+    """Замеряет ожидание в _do_get: очередь пула + создание нового соединения"""
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics.pool = self
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.wait.observe(time.perf_counter() - started)
+
+
+def pool_options(is_async: bool, metrics: PoolMetrics, mode: str = DB_POOL_MODE, size: int = DB_POOL_SIZE,
+                 max_overflow: int = DB_MAX_OVERFLOW, timeout: float = DB_POOL_TIMEOUT) -> dict:
+    """Аргументы create_engine/create_async_engine для пула с метриками"""
+    if mode in ("null", "pgbouncer"):
+        base = NullPool
+        options = {}
+    else:
+        base = AsyncAdaptedQueuePool if is_async else QueuePool
+        options = {
+            "pool_size": size,
+            "max_overflow": max_overflow,
+            "pool_timeout": timeout,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+        }
+    # Свой подкласс на движок: pool.recreate() сохраняет класс, а значит и метрики
+    options["poolclass"] = type(f"Timed{base.__name__}", (TimedPoolMixin, base), {"metrics": metrics})
+    return options
+
+
+def track_checkouts(engine, metrics: PoolMetrics):
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checked_out += 1
+        metrics.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        metrics.checked_out -= 1
+
+
+def make_async_engine(url: str, metrics: PoolMetrics, mode: str = DB_POOL_MODE, connect_args: dict = None,
+                      **pool_kwargs):
+    """Асинхронный движок с настроенным пулом (используется и в benchmarks/pool_saturation.py)"""
+    connect_args = dict(connect_args or {})
+    if mode == "pgbouncer" and url.startswith("postgresql+asyncpg://"):
+        # pgbouncer в режиме transaction не поддерживает именованные prepared statements
+        connect_args["statement_cache_size"] = 0
+        url += ("&" if "?" in url else "?") + "prepared_statement_cache_size=0"
+    engine = create_async_engine(
+        url,
+        connect_args=connect_args,
+        **pool_options(True, metrics, mode=mode, **pool_kwargs)
+    )
+    track_checkouts(engine.sync_engine, metrics)
+    return engine
+
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+def render_pool_metrics() -> list:
+    """Строки Prometheus для обоих пулов (коллектор metrics.registry)"""
+    lines = []
+    pools = (("async", async_pool_metrics), ("sync", sync_pool_metrics))
+    for name, kind, key in (
+        ("db_pool_checked_out", "gauge", "checked_out"),
+        ("db_pool_overflow", "gauge", "overflow"),
+        ("db_pool_checkouts_total", "counter", "checkouts"),
+        ("db_pool_timeouts_total", "counter", "timeouts"),
+    ):
+        lines.append(f"# TYPE {name} {kind}")
+        for engine_name, metrics in pools:
+            value = metrics.snapshot()[key]
+            if value is not None:
+                lines.append(f'{name}{{engine="{engine_name}"}} {value}')
+    lines.append("# TYPE db_pool_wait_seconds histogram")
+    for engine_name, metrics in pools:
+        lines.extend(render_histogram("db_pool_wait_seconds", ("engine",), (engine_name,), metrics.wait))
+    return lines
+
+# Подсчет SQL запросов (для проверки N+1 и бюджета запросов на эндпоинт) и их время для /metrics
+_query_log = contextvars.ContextVar("query_log", default=None)
+
+
+def _log_query(conn, cursor, statement, parameters, context, executemany):
+    statements = _query_log.get()
+    if statements is not None:
+        statements.append(statement)
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        record_query(time.perf_counter() - started)
+
+
+def instrument(engine):
+    """Подсчет/время SQL и (при SQL_PROFILE) профилирование для движка"""
+    event.listen(engine, "before_cursor_execute", _log_query)
+    event.listen(engine, "after_cursor_execute", _time_query)
+    if SQL_PROFILE:
+        # Комментарии route, лог медленных запросов и трассы (profiling.py)
+        install_profiling(engine)
+
+
+IS_POSTGRES = bool(DATABASE_URL and DATABASE_URL.startswith("postgresql://"))
+
+if IS_POSTGRES:
     # Для Render PostgreSQL
     # Преобразуем URL для psycopg2
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://")
 
-    # Создаем SSL контекст
-    ssl_context = ssl.create_default_context()
+    # SSL для asyncpg (psycopg2/libpq настраивается через sslmode).
+    # Сертификат не проверяется, поэтому системные CA не загружаем (create_default_context их читает)
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE  # Отключаем проверку сертификата
-    connect_args = {
-        # Вариант 1: Самый простой (часто работает)
-        "sslmode": "require",
-
-        # ИЛИ Вариант 2: Без проверки хоста
-        # "sslmode": "verify-ca",
-        # "sslrootcert": "",
-
-        # ИЛИ Вариант 3: Без SSL (опасно, только для теста)
-        # "sslmode": "disable",
-    }
-    engine = create_engine(
-        DATABASE_URL,
-        pool_pre_ping=True,
-        pool_recycle=300,
-        pool_size=5,
-        max_overflow=10,
+
+    # Асинхронный движок для обработчиков FastAPI (asyncpg)
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg2://", "postgresql+asyncpg://")
+    async_engine = make_async_engine(
+        ASYNC_DATABASE_URL,
+        async_pool_metrics,
         connect_args={
-            "sslmode": "require",
-            "sslrootcert": "",  # Пустая строка для автоматического определения
-            "ssl": ssl_context,  # Явно передаем SSL контекст
-            "connect_timeout": 10,
-            "keepalives": 1,
-            "keepalives_idle": 30,
-            "keepalives_interval": 10,
-            "keepalives_count": 5
+            "ssl": ssl_context,  # asyncpg принимает SSL контекст напрямую
+            "timeout": 10
         }
     )
 else:
     # Fallback на SQLite
     DATABASE_URL = "sqlite:///./test.db"
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False}
-    )
+    ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+    async_engine = make_async_engine(ASYNC_DATABASE_URL, async_pool_metrics)
+
+instrument(async_engine.sync_engine)
+registry.add_collector(render_pool_metrics)
+
+# expire_on_commit=False: после commit атрибуты не перечитываются лениво (в async это запрещено)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+_engine = None
+_session_local = None
+
+
+def get_engine():
+    """Синхронный движок (psycopg2) для миграций, rescore.py и скриптов.
+    Создается при первом обращении: веб-процессу он не нужен"""
+    global _engine
+    if _engine is None:
+        if IS_POSTGRES:
+            _engine = create_engine(
+                DATABASE_URL,
+                connect_args={
+                    "sslmode": "require",
+                    "connect_timeout": 10,
+                    "keepalives": 1,
+                    "keepalives_idle": 30,
+                    "keepalives_interval": 10,
+                    "keepalives_count": 5
+                },
+                **pool_options(False, sync_pool_metrics)
+            )
+        else:
+            _engine = create_engine(
+                DATABASE_URL,
+                connect_args={"check_same_thread": False},
+                **pool_options(False, sync_pool_metrics)
+            )
+        track_checkouts(_engine, sync_pool_metrics)
+        instrument(_engine)
+    return _engine
+
+
+def __getattr__(name):
+    # from database import engine / SessionLocal - ленивые синхронный движок и фабрика сессий
+    global _session_local
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        if _session_local is None:
+            _session_local = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+        return _session_local
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@contextmanager
+def count_queries():
+    """Собирает SQL запросы, выполненные внутри блока: with count_queries() as statements"""
+    statements = []
+    token = _query_log.set(statements)
+    try:
+        yield statements
+    finally:
+        _query_log.reset(token)
+
+
+# ==================== Старт и готовность ====================
+
+# Сколько соединений пула открыть при старте (параллельно, в фоне)
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "2"))
+DB_READY_TIMEOUT = float(os.getenv("DB_READY_TIMEOUT", "2"))
+
+
+async def prewarm_pool(count: int = DB_POOL_PREWARM) -> int:
+    """Открывает до count соединений одновременно и возвращает их в пул; число открытых"""
+    if DB_POOL_MODE != "queue":
+        return 0  # NullPool: соединения не переиспользуются, греть нечего
+    count = min(count, DB_POOL_SIZE)
+
+    async def open_connection():
+        conn = await async_engine.connect()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    results = await asyncio.gather(*(open_connection() for _ in range(count)), return_exceptions=True)
+    opened = [conn for conn in results if not isinstance(conn, BaseException)]
+    for conn in opened:
+        await conn.close()
+    errors = [error for error in results if isinstance(error, BaseException)]
+    if errors:
+        print(f"⚠️ Прогрев пула: открыто {len(opened)} из {count} соединений: {errors[0]}")
+    return len(opened)
+
+
+async def check_database(timeout: float = DB_READY_TIMEOUT) -> Optional[str]:
+    """None, если БД отвечает; иначе описание ошибки"""
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.wait_for(ping(), timeout)
+    except asyncio.TimeoutError:
+        return f"нет ответа за {timeout} с"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def pool_exhausted(metrics: PoolMetrics = async_pool_metrics) -> bool:
+    """Все соединения пула (включая overflow) заняты"""
+    if DB_POOL_MODE != "queue":
+        return False
+    return metrics.checked_out >= DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+
+def run_migrations(revision: str = "head"):
+    """alembic upgrade head: схема БД создается и меняется только миграциями"""
+    from alembic import command
+    from alembic.config import Config
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(base_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(base_dir, "migrations"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, revision)
@@ -0,0 +1,84 @@
+# events.py
+import os
+import json
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+
+class LocalBus:
+    """Pub/sub в пределах одного процесса (для одного воркера и для тестов)"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+
+    async def publish(self, channel: str, event: dict):
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue.full():
+                # Медленный клиент: выбрасываем самое старое событие, а не блокируем отправителя
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[channel].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[channel].discard(queue)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._subscribers.get(channel, ()))
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self) -> dict:
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message["data"])
+
+
+class RedisBus:
+    """Pub/sub через Redis, чтобы события доходили до клиентов на любом воркере"""
+
+    def __init__(self, url: str, prefix: str = "loveapp"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def publish(self, channel: str, event: dict):
+        await self.client.publish(f"{self.prefix}:{channel}", json.dumps(event, default=str))
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(f"{self.prefix}:{channel}")
+        try:
+            yield RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+
+def make_bus():
+    """Redis, если задан EVENTS_REDIS_URL, иначе локальная шина"""
+    redis_url = os.getenv("EVENTS_REDIS_URL")
+    if redis_url:
+        return RedisBus(redis_url)
+    return LocalBus()
+
+
+def couple_channel(couple_id: int) -> str:
+    return f"couple:{couple_id}"
+
+
+event_bus = make_bus()
@@ -1,38 +1,98 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, status, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, status, Request, Query, Response
+from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached, aliased
 from typing import List, Optional
-import shutil
 import os
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from datetime import datetime
+from contextlib import asynccontextmanager
 import uuid
 import json
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
 import hashlib
+from pydantic import BaseModel
+import base64
+import asyncio
+import time
 
 # 1. СНАЧАЛА импортируем модели и схемы
-from models import Base, User, Couple, Test, TestResult, SharedTestResult, LoveMessage
-from database import engine, SessionLocal
+from models import (
+    User, Couple, TestVersion, TestSession, TestResult, SharedTestResult, LoveMessage,
+    CoupleStats, UserStats
+)
+from database import async_engine, AsyncSessionLocal, run_migrations
+from database import DB_POOL_MODE, async_pool_metrics, sync_pool_metrics
+from database import prewarm_pool, check_database, pool_exhausted
+from metrics import MetricsMiddleware, registry
+from compression import CompressionMiddleware
+from serialization import FastJSONResponse, json_response, loads, user_serializer, couple_serializer, token_serializer
+from profiling import SQL_PROFILE, ProfilingMiddleware, recent_traces
 from schemas import (
     UserCreate, UserResponse, UserLogin,
     CoupleCreate, CoupleResponse,
     TestCreate, TestResponse, TestQuestion,
     TestAnswer, TestResultResponse,
     SharedResultResponse, LoveMessageCreate,
-    Token, TokenData
+    Token, RefreshRequest
+)
+from sqlalchemy import text, select, func, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from cache import user_cache, couple_cache
+from events import event_bus, couple_channel
+import avatars
+import passwords
+import ratelimit
+import tokens
+from tokens import TokenClaims
+from media import media_response, etag_matches
+from catalog import test_catalog, content_hash
+from scoring import get_scorer, ScoringError
+from stats import bump_couple_stats, bump_user_stats, compute_couple_stats, compute_user_stats
+
+
+# Состояние старта для /ready и логов
+startup_state = {"startup_seconds": None, "prewarmed_connections": None, "prewarm_done": False}
+
+
+async def prewarm_connections():
+    started = time.perf_counter()
+    startup_state["prewarmed_connections"] = await prewarm_pool()
+    startup_state["prewarm_done"] = True
+    print(f"✅ Пул прогрет за {time.perf_counter() - started:.3f} с, "
+          f"соединений: {startup_state['prewarmed_connections']}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Импорт main не делает ничего, кроме создания объектов: файлы, БД и каталог - только здесь
+    started = time.perf_counter()
+    os.makedirs(AVATAR_DIR, exist_ok=True)
+    # В production миграции запускаются отдельно (preDeployCommand в render.yaml)
+    if os.getenv("ENVIRONMENT") != "production":
+        await run_in_threadpool(run_migrations)
+    test_catalog.load()
+    # Соединения открываются в фоне: запросы принимаются сразу, /ready ждет окончания прогрева
+    prewarm_task = asyncio.create_task(prewarm_connections())
+    startup_state["startup_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"✅ Приложение запущено за {startup_state['startup_seconds']} с")
+    yield
+    prewarm_task.cancel()
+    avatars.shutdown_executor()
+    passwords.shutdown_executor()
+    await async_engine.dispose()
+
+
+app = FastAPI(
+    title="Love Application",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
-from sqlalchemy import text
-
-
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Love Application", version="1.0.0")
 
 # CORS
 app.add_middleware(
@@ -48,77 +108,162 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=600,  # Кэшировать preflight на 10 минут
 )
-
-# Настройки
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256", "django_argon2", "django_bcrypt"],
-    deprecated="auto"
-)
+# gzip/br для JSON ответов больше COMPRESS_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+# 413 для слишком больших загрузок аватара до того, как Starlette сохранит multipart целиком
+app.add_middleware(avatars.UploadLimitMiddleware)
+# Request id и трассы SQL (только при SQL_PROFILE=true)
+if SQL_PROFILE:
+    app.add_middleware(ProfilingMiddleware)
+
+# Настройки (SECRET_KEY и сроки жизни токенов - в tokens.py)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # Директория для загрузки файлов
 UPLOAD_DIR = "uploads"
-AVATAR_DIR = os.path.join(UPLOAD_DIR, "avatars")
-os.makedirs(AVATAR_DIR, exist_ok=True)
+AVATAR_DIR = os.path.join(UPLOAD_DIR, "avatars")  # Создается в lifespan
 
-# Dependency для БД
-def get_db():
-    db = SessionLocal()
-    try:
+# Dependency для БД (асинхронная сессия, не блокирует event loop)
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # Вспомогательные функции
-def get_password_hash(password: str) -> str:
-    """Простое хеширование SHA256 (устраняет проблему bcrypt)"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Простая проверка пароля"""
-    return get_password_hash(plain_password) == hashed_password
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def server_busy() -> HTTPException:
+    # Очередь хэширования паролей или лимит конкурентности переполнены: отказываем быстро
+    return HTTPException(status_code=503, detail="Сервер перегружен, попробуйте позже",
+                         headers={"Retry-After": "1"})
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Слишком много запросов, попробуйте позже",
+                         headers={"Retry-After": ratelimit.retry_after_header(retry_after)})
+
+
+def client_key(request: Request) -> str:
+    """Ключ rate limit: пользователь из access токена (проверка из LRU tokens.py), иначе IP"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{tokens.verify_access_token(token).user_id}"
+        except tokens.InvalidToken:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def admission(rate_limit: str, concurrency_group: str):
+    """Dependency маршрута: token bucket и слот лимита конкурентности до открытия сессии БД"""
+    rate_limiter = ratelimit.rate_limiters[rate_limit]
+    concurrency_limiter = ratelimit.concurrency_limiters[concurrency_group]
+
+    async def dependency(request: Request):
+        if not ratelimit.RATE_LIMIT_ENABLED:
+            yield
+            return
+        try:
+            slot = await ratelimit.admit(rate_limiter, client_key(request), concurrency_limiter)
+        except ratelimit.RateLimited as e:
+            raise too_many_requests(e.retry_after)
+        except ratelimit.Overloaded:
+            raise server_busy()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    return dependency
+
+
+def credentials_error() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def issue_tokens(db: AsyncSession, user: User, refresh_token: Optional[str] = None) -> dict:
+    """Пара access + refresh; commit (строка refresh_tokens) делает вызывающий"""
+    return {
+        "access_token": tokens.create_access_token(user.id, user.couple_id),
+        "refresh_token": refresh_token or tokens.issue_refresh_token(db, user.id),
+        "token_type": "bearer",
+        "expires_in": tokens.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = TokenData(user_id=user_id)
-    except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+        return tokens.verify_access_token(token)
+    except tokens.InvalidToken:
+        raise credentials_error()
+
+
+async def get_current_user(claims: TokenClaims = Depends(get_token_claims), db: AsyncSession = Depends(get_db)):
+    user = await load_user(db, claims.user_id)
     if user is None:
-        raise credentials_exception
+        raise credentials_error()
     return user
 
 
+async def with_fresh_couple(claims: TokenClaims, db: AsyncSession) -> TokenClaims:
+    # Пара могла появиться после выдачи токена (create/join), а выйти из пары нельзя,
+    # поэтому перепроверяем (через кэш пользователей) только токены без cid
+    if claims.couple_id is None:
+        user = await load_user(db, claims.user_id)
+        if user is None:
+            raise credentials_error()
+        claims = claims._replace(couple_id=user.couple_id)
+    return claims
+
+
+async def get_current_claims(
+        claims: TokenClaims = Depends(get_token_claims),
+        db: AsyncSession = Depends(get_db)
+) -> TokenClaims:
+    """Для обработчиков, которым нужны только id пользователя и пары: без загрузки User"""
+    return await with_fresh_couple(claims, db)
+
+
+# Поля пользователя, которые кэшируются (без password_hash)
+USER_CACHE_FIELDS = ("id", "email", "username", "gender", "avatar_url", "couple_id")
+
+
+async def load_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Пользователь из кэша (без запроса к БД) или из БД с заполнением кэша"""
+    data = await user_cache.get(user_id)
+    if data is not None:
+        user = User(**{field: data[field] for field in USER_CACHE_FIELDS})
+        user.created_at = datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+        # Привязываем к сессии без SELECT, чтобы изменения обработчиков сохранялись через commit
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    user = await db.get(User, user_id)
+    if user is not None:
+        await cache_user(user)
+    return user
+
+
+async def cache_user(user: User):
+    data = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+    data["created_at"] = user.created_at.isoformat() if user.created_at else None
+    await user_cache.set(user.id, data)
+
+
 # Функция для генерации кода пары
 def generate_couple_code():
     return str(uuid.uuid4())[:8].upper()
 
 
+async def get_table_names():
+    """Список таблиц через async движок (inspect работает только с sync соединением)"""
+    from sqlalchemy import inspect
+
+    async with async_engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+
+
 # =========== CORS FIX: OPTIONS HANDLER ===========
 from fastapi import Request
 
@@ -130,31 +275,31 @@ async def root():
         "endpoints": {
             "register": "/register",
             "login": "/login",
+            "refresh": "/token/refresh",
             "health": "/health",
+            "ready": "/ready",
             "profile": "/profile",
             "tests": "/tests/available",
-            "couples": "/couples/my"
+            "couples": "/couples/my",
+            "dashboard": "/dashboard"
         }
     }
 
 @app.get("/admin/init-db")
-def init_db():
+async def init_db():
     """Инициализация БД через веб-интерфейс"""
     try:
-        from sqlalchemy import text
-        from database import engine
-
         database_url = os.getenv("DATABASE_URL", "")
 
-        with engine.connect() as conn:
+        async with async_engine.connect() as conn:
             if "postgres" in database_url:
                 try:
-                    conn.execute(text("GRANT ALL ON SCHEMA public TO loveapp_user;"))
+                    await conn.execute(text("GRANT ALL ON SCHEMA public TO loveapp_user;"))
                     print("✅ Права выданы")
                 except Exception as grant_error:
                     print(f"⚠️ Не удалось выдать права: {grant_error}")
 
-            conn.commit()
+            await conn.commit()
 
         return {
                 "message": "База данных инициализирована",
@@ -171,13 +316,11 @@ async def test_database():
     """Тестирование БД"""
     try:
         # Проверяем подключение
-        with SessionLocal() as db:
-            db.execute("SELECT 1")
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
 
         # Проверяем таблицы
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
+        tables = await get_table_names()
 
         return {
             "status": "success",
@@ -186,7 +329,7 @@ async def test_database():
             "database_type": "PostgreSQL" if "postgres" in os.getenv("DATABASE_URL", "") else "SQLite",
             "tables": tables,
             "table_count": len(tables),
-            "engine_url": str(engine.url)
+            "engine_url": str(async_engine.url)
         }
     except Exception as e:
         return {
@@ -199,10 +342,7 @@ async def test_database():
 @app.get("/admin/check-tables")
 async def check_tables():
     """Проверка существующих таблиц"""
-    from sqlalchemy import inspect
-
-    inspector = inspect(engine)
-    tables = inspector.get_table_names()
+    tables = await get_table_names()
 
     return {
         "tables": tables,
@@ -233,6 +373,11 @@ async def add_cors_headers(request: Request, call_next):
     return response
 
 
+# Метрики запросов для /metrics. Регистрируется после всех middleware (включая add_cors_headers
+# выше): последний зарегистрированный - самый внешний слой, его время тоже попадает в метрики
+app.add_middleware(MetricsMiddleware)
+
+
 # Явные обработчики OPTIONS для /register и /login
 @app.options("/register")
 @app.options("/login")
@@ -251,15 +396,21 @@ async def options_handler():
 
 # ==================== Аутентификация ====================
 
-@app.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+@app.post("/register", response_model=UserResponse, dependencies=[Depends(admission("register", "auth"))])
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     # Проверяем, есть ли уже пользователь с таким email
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
+    # Соединение возвращается в пул до KDF: ожидание пула хэширования не держит транзакцию
+    await db.rollback()
 
     # Создаем пользователя
-    hashed_password = get_password_hash(user_data.password)
+    # KDF считается в пуле passwords.py, event loop не блокируется
+    try:
+        hashed_password = await passwords.hash_password_async(user_data.password)
+    except passwords.HashingBusy:
+        raise server_busy()
     user = User(
         email=user_data.email,
         username=user_data.username,
@@ -268,68 +419,133 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Тот же email зарегистрирован параллельно, пока считался хэш
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
+    await db.refresh(user)
 
-    return user
+    return user_serializer.response(user)
 
 class LoginForm(BaseModel):
     username: str
     password: str
 
 
-@app.post("/login", response_model=Token)
-async def login(login_data: LoginForm, db: Session = Depends(get_db)):
+@app.post("/login", response_model=Token, dependencies=[Depends(admission("login", "auth"))])
+async def login(login_data: LoginForm, db: AsyncSession = Depends(get_db)):
     # Ищем пользователя по email (который приходит как username)
-    user = db.query(User).filter(User.email == login_data.username).first()
+    user = await db.scalar(select(User).where(User.email == login_data.username))
+    if user is not None:
+        # Отсоединяем, чтобы rollback не сбросил атрибуты
+        db.expunge(user)
+    # Соединение возвращается в пул до KDF: ожидание пула хэширования не держит транзакцию
+    await db.rollback()
+
+    try:
+        verified, new_hash = await passwords.verify_password_async(
+            login_data.password, user.password_hash if user else None
+        )
+    except passwords.HashingBusy:
+        raise server_busy()
 
-    if not user or not verify_password(login_data.password, user.password_hash):
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
+    if new_hash:
+        # Старый SHA-256 или устаревшая стоимость KDF: сохраняем новый хэш (новая транзакция)
+        user = await db.merge(user, load=False)
+        user.password_hash = new_hash
 
-    return {"access_token": access_token, "token_type": "bearer"}
+    token = issue_tokens(db, user)
+    await db.commit()
+    return token_serializer.response(token)
+
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_token(request_data: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Обмен refresh токена на новую пару (старый refresh токен больше не действует)"""
+    try:
+        user_id, new_refresh_token = await tokens.rotate_refresh_token(db, request_data.refresh_token)
+    except tokens.InvalidToken:
+        raise credentials_error()
+
+    # couple_id для claims берется из кэша пользователей
+    user = await load_user(db, user_id)
+    if user is None:
+        raise credentials_error()
+    token = issue_tokens(db, user, refresh_token=new_refresh_token)
+    await db.commit()
+    return token_serializer.response(token)
+
+
+@app.post("/logout")
+async def logout(
+        request_data: Optional[RefreshRequest] = None,
+        claims: TokenClaims = Depends(get_token_claims),
+        db: AsyncSession = Depends(get_db)
+):
+    tokens.revoke_access_token(claims)
+    if request_data is not None:
+        await tokens.revoke_refresh_token(db, request_data.refresh_token, claims.user_id)
+        await db.commit()
+    return {"message": "Вы вышли из аккаунта"}
 
 
 # ==================== Профиль и аватар ====================
 
 @app.get("/profile", response_model=UserResponse)
 async def get_profile(current_user: User = Depends(get_current_user)):
-    return current_user
+    # Данные из БД/кэша уже соответствуют UserResponse: без повторной валидации
+    return user_serializer.response(current_user)
 
 
 @app.post("/upload-avatar")
 async def upload_avatar(
         file: UploadFile = File(...),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     # Проверяем тип файла
-    if not file.content_type.startswith("image/"):
+    if not (file.content_type or "").startswith("image/"):
         raise HTTPException(status_code=400, detail="Можно загружать только изображения")
 
-    # Генерируем уникальное имя файла
-    file_ext = file.filename.split(".")[-1]
-    filename = f"{current_user.id}_{int(datetime.utcnow().timestamp())}.{file_ext}"
-    file_path = os.path.join(AVATAR_DIR, filename)
+    # Читаем кусками с ограничением размера, sha256 считается по ходу чтения
+    try:
+        data, digest = await avatars.read_upload(file)
+    except avatars.AvatarTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Файл больше {avatars.MAX_AVATAR_BYTES // (1024 * 1024)} МБ"
+        )
 
-    # Сохраняем файл
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Ресайз в пуле процессов; имя файла = хэш содержимого (одинаковые загрузки не дублируются)
+    try:
+        filenames = await avatars.store_avatar(data, digest, AVATAR_DIR)
+    except avatars.InvalidImage:
+        raise HTTPException(status_code=400, detail="Не удалось прочитать изображение")
 
     # Обновляем URL аватара в базе
-    avatar_url = f"/uploads/avatars/{filename}"
+    sizes = {size: f"/uploads/avatars/{name}" for size, name in filenames.items()}
+    avatar_url = sizes[avatars.AVATAR_MAIN_SIZE]
     current_user.avatar_url = avatar_url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
+    if current_user.couple_id:
+        # Аватар партнера входит в ответ /couples/my
+        await couple_cache.invalidate(current_user.couple_id)
 
-    return {"avatar_url": avatar_url, "message": "Аватар успешно загружен"}
+    return {
+        "avatar_url": avatar_url,
+        "sizes": {str(size): url for size, url in sizes.items()},
+        "message": "Аватар успешно загружен"
+    }
 
 
 # ==================== Пары ====================
@@ -338,7 +554,7 @@ async def upload_avatar(
 async def create_couple(
         couple_name: str = Form(...),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     # Проверяем, что у пользователя еще нет пары
     if current_user.couple_id:
@@ -352,12 +568,13 @@ async def create_couple(
     )
 
     db.add(couple)
-    db.flush()
+    await db.flush()
+    db.add(CoupleStats(couple_id=couple.id))
 
     # Привязываем пользователя к паре
     current_user.couple_id = couple.id
-    db.commit()
-    db.refresh(couple)
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
 
     return {
         "couple_id": couple.id,
@@ -370,25 +587,29 @@ async def create_couple(
 async def join_couple(
         couple_code: str = Form(...),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     # Проверяем, что у пользователя еще нет пары
     if current_user.couple_id:
         raise HTTPException(status_code=400, detail="Вы уже состоите в паре")
 
     # Находим пару по коду
-    couple = db.query(Couple).filter(Couple.couple_code == couple_code).first()
+    couple = await db.scalar(select(Couple).where(Couple.couple_code == couple_code))
     if not couple:
         raise HTTPException(status_code=404, detail="Пара с таким кодом не найдена")
 
     # Проверяем, что в паре есть место (максимум 2 человека)
-    partner_count = db.query(User).filter(User.couple_id == couple.id).count()
+    partner_count = await db.scalar(
+        select(func.count()).select_from(User).where(User.couple_id == couple.id)
+    )
     if partner_count >= 2:
         raise HTTPException(status_code=400, detail="В этой паре уже есть двое участников")
 
     # Привязываем пользователя к паре
     current_user.couple_id = couple.id
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
+    await couple_cache.invalidate(couple.id)
 
     return {
         "couple_id": couple.id,
@@ -399,16 +620,32 @@ async def join_couple(
 
 @app.get("/couples/my", response_model=CoupleResponse)
 async def get_my_couple(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        request: Request,
+        claims: TokenClaims = Depends(get_current_claims),
+        db: AsyncSession = Depends(get_db)
 ):
-    if not current_user.couple_id:
+    if not claims.couple_id:
         raise HTTPException(status_code=404, detail="Вы не состоите в паре")
 
-    couple = db.query(Couple).filter(Couple.id == current_user.couple_id).first()
+    # Ответ одинаков для обоих партнеров, поэтому кэшируется целиком по couple_id
+    cached = await couple_cache.get(claims.couple_id)
+    if cached is None:
+        cached = await build_couple_response(db, claims.couple_id)
+        await couple_cache.set(claims.couple_id, cached)
+
+    headers = {"ETag": cached["etag"], "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, cached["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached["body"].encode(), media_type="application/json", headers=headers)
+
+
+async def build_couple_response(db: AsyncSession, couple_id: int) -> dict:
+    """Тело CoupleResponse и его ETag (строка, чтобы значение подходило и для Redis)"""
+    couple = await db.get(Couple, couple_id)
 
     # Получаем информацию о партнере
-    partners = db.query(User).filter(User.couple_id == couple.id).all()
+    partners = (await db.scalars(select(User).where(User.couple_id == couple.id))).all()
     partner_info = []
     for partner in partners:
         partner_info.append({
@@ -418,68 +655,76 @@ async def get_my_couple(
             "avatar_url": partner.avatar_url
         })
 
-    return {
+    body = couple_serializer.render({
         "id": couple.id,
         "couple_code": couple.couple_code,
         "relationship_name": couple.relationship_name,
         "avatar_url": couple.avatar_url,
         "created_at": couple.created_at,
         "partners": partner_info
-    }
+    })
+    return {"body": body.decode(), "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
 
 
 # ==================== Тесты ====================
 
-# Предзаполненные тесты
-DEFAULT_TESTS = [
-    {
-        "title": "Тест на совместимость",
-        "description": "Узнайте, насколько вы подходите друг другу",
-        "category": "compatibility",
-        "questions": [
-            {"id": 1, "text": "Насколько вы цените время, проведенное вместе?", "options": [
-                {"value": 1, "text": "Не очень"},
-                {"value": 2, "text": "Иногда"},
-                {"value": 3, "text": "Часто"},
-                {"value": 4, "text": "Очень"}
-            ]},
-            {"id": 2, "text": "Как часто вы обсуждаете будущее?", "options": [
-                {"value": 1, "text": "Никогда"},
-                {"value": 2, "text": "Редко"},
-                {"value": 3, "text": "Иногда"},
-                {"value": 4, "text": "Часто"}
-            ]}
-        ]
-    },
-    {
-        "title": "Тест на любовные языки",
-        "description": "Определите ваши языки любви",
-        "category": "love",
-        "questions": [
-            {"id": 1, "text": "Что для вас важнее в отношениях?", "options": [
-                {"value": "words", "text": "Слова поддержки"},
-                {"value": "time", "text": "Время вместе"},
-                {"value": "gifts", "text": "Подарки"},
-                {"value": "touch", "text": "Физический контакт"}
-            ]}
-        ]
-    }
-]
-
-
 @app.get("/tests/available")
-async def get_available_tests(current_user: User = Depends(get_current_user)):
-    return DEFAULT_TESTS
+async def get_available_tests(request: Request, current_user: User = Depends(get_current_user)):
+    # Тело ответа сериализовано заранее при загрузке каталога, ETag - хэш этого тела
+    test_catalog.refresh()
+    headers = {"ETag": test_catalog.etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, test_catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=test_catalog.body, media_type="application/json", headers=headers)
+
+
+# content_hash -> test_versions.id (версии неизменяемы, поэтому кэш не инвалидируется)
+_test_version_ids = {}
+
+
+async def get_test_version_id(db: AsyncSession, test_data: dict) -> int:
+    """id версии теста из каталога; строка создается один раз на содержимое"""
+    version_hash = content_hash(test_data)
+    version_id = _test_version_ids.get(version_hash)
+    if version_id is not None:
+        return version_id
+
+    version_query = select(TestVersion.id).where(TestVersion.content_hash == version_hash)
+    version_id = await db.scalar(version_query)
+    if version_id is not None:
+        # Строка уже закоммичена: id можно кэшировать
+        _test_version_ids[version_hash] = version_id
+        return version_id
+
+    version = TestVersion(
+        catalog_id=test_data.get("id"),
+        slug=test_data.get("slug"),
+        content_hash=version_hash,
+        title=test_data["title"],
+        description=test_data["description"],
+        category=test_data["category"],
+        questions=test_data["questions"]
+    )
+    try:
+        # Savepoint: при гонке откатывается только вставка версии, а не транзакция запроса
+        async with db.begin_nested():
+            db.add(version)
+        # В кэш не кладем: транзакция запроса еще может откатиться
+        return version.id
+    except IntegrityError:
+        # Ту же версию одновременно создал другой запрос
+        return await db.scalar(version_query)
 
 
 @app.post("/tests/start")
 async def start_test(
         test_title: str = Form(...),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
-    # Находим тест по названию
-    test_data = next((t for t in DEFAULT_TESTS if t["title"] == test_title), None)
+    # Находим тест по названию (или slug/id из каталога)
+    test_data = test_catalog.find(test_title)
     if not test_data:
         raise HTTPException(status_code=404, detail="Тест не найден")
 
@@ -487,36 +732,59 @@ async def start_test(
     if not current_user.couple_id:
         raise HTTPException(status_code=400, detail="Для прохождения теста нужно быть в паре")
 
-    # Создаем запись теста
-    test = Test(
-        title=test_data["title"],
-        description=test_data["description"],
-        category=test_data["category"],
-        questions=json.dumps(test_data["questions"]),
+    # Прохождение ссылается на версию теста; вопросы не копируются в каждую строку
+    session = TestSession(
+        test_version_id=await get_test_version_id(db, test_data),
         couple_id=current_user.couple_id,
         created_by=current_user.id
     )
 
-    db.add(test)
-    db.commit()
-    db.refresh(test)
+    db.add(session)
+    await db.commit()
 
     return {
-        "test_id": test.id,
-        "title": test.title,
-        "questions": json.loads(test.questions)
+        "test_id": session.id,
+        "title": test_data["title"],
+        "questions": test_data["questions"]
     }
 
 
-@app.post("/tests/{test_id}/submit")
+async def upsert_shared_result(db: AsyncSession, **values) -> datetime:
+    """INSERT ... ON CONFLICT (couple_id, test_id) DO UPDATE; возвращает created_at строки"""
+    insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(SharedTestResult).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[SharedTestResult.couple_id, SharedTestResult.test_id],
+        set_={
+            key: statement.excluded[key]
+            for key in ("combined_score", "compatibility_percentage", "insights")
+        }
+    ).returning(SharedTestResult.created_at)
+    return await db.scalar(statement)
+
+
+@app.post("/tests/{test_id}/submit", dependencies=[Depends(admission("tests", "writes"))])
 async def submit_test(
         test_id: int,
         answers: List[TestAnswer],
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
-    # Получаем тест
-    test = db.query(Test).filter(Test.id == test_id).first()
+    # FOR UPDATE по строке прохождения сериализует одновременные отправки партнеров.
+    # Блокировка - отдельным запросом: в READ COMMITTED после ожидания блокировки
+    # перечитывается только заблокированная строка, а не присоединенные к ней
+    test = (await db.execute(
+        select(
+            TestSession.couple_id,
+            TestVersion.title,
+            TestVersion.catalog_id,
+            TestVersion.content_hash,
+            TestVersion.questions
+        )
+        .join(TestVersion, TestSession.test_version_id == TestVersion.id)
+        .where(TestSession.id == test_id)
+        .with_for_update(of=TestSession)
+    )).first()
     if not test:
         raise HTTPException(status_code=404, detail="Тест не найден")
 
@@ -524,67 +792,69 @@ async def submit_test(
     if test.couple_id != current_user.couple_id:
         raise HTTPException(status_code=403, detail="Нет доступа к этому тесту")
 
-    # Вычисляем результат
-    score = 0
-    for answer in answers:
-        # Простая логика подсчета очков
-        if isinstance(answer.answer_value, int):
-            score += answer.answer_value
-        else:
-            score += 1
-
-    # Интерпретация результата
-    interpretation = ""
-    if score < 3:
-        interpretation = "Есть над чем поработать"
-    elif score < 6:
-        interpretation = "Хороший результат"
-    else:
-        interpretation = "Отличная совместимость!"
+    # Новый запрос - новый снимок: результат партнера, сохраненный до снятия блокировки, виден
+    partner = (await db.execute(
+        select(
+            TestResult.answers,
+            TestResult.score,
+            select(SharedTestResult.compatibility_percentage)
+            .where(SharedTestResult.test_id == test_id)
+            .scalar_subquery()
+            .label("shared_compatibility")
+        )
+        .where(TestResult.test_id == test_id, TestResult.user_id != current_user.id)
+        .order_by(TestResult.completed_at.desc(), TestResult.id.desc())
+        .limit(1)
+    )).first()
+
+    # Вычисляем результат по модели подсчета теста из каталога
+    scorer = get_scorer(
+        test.content_hash, test.questions, test_catalog.scoring_for(test.catalog_id, test.content_hash)
+    )
+    answer_dicts = [a.model_dump() for a in answers]
+    try:
+        score, interpretation = scorer.score_one(answer_dicts)
+    except ScoringError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Сохраняем результат
     result = TestResult(
         user_id=current_user.id,
         test_id=test_id,
-        answers=json.dumps([a.dict() for a in answers]),
+        answers=answer_dicts,
         score=score,
         interpretation=interpretation
     )
 
     db.add(result)
-    db.commit()
-
-    # Проверяем, прошел ли партнер тест
-    partner = db.query(User).filter(
-        User.couple_id == current_user.couple_id,
-        User.id != current_user.id
-    ).first()
-
-    partner_result = db.query(TestResult).filter(
-        TestResult.test_id == test_id,
-        TestResult.user_id == partner.id
-    ).first() if partner else None
-
-    # Если оба прошли тест, создаем общий результат
-    if partner_result:
-        combined_score = (score + partner_result.score) / 2
-        compatibility = min(int((combined_score / 8) * 100), 100)
-
-        shared_result = SharedTestResult(
-            couple_id=current_user.couple_id,
-            test_id=test_id,
-            combined_score=int(combined_score),
-            compatibility_percentage=compatibility,
-            insights=json.dumps({
-                "user1_score": score,
-                "user2_score": partner_result.score,
-                "comparison": "Ваши результаты хорошо дополняют друг друга" if abs(
-                    score - partner_result.score) <= 2 else "Есть различия в подходах"
-            })
+    await bump_user_stats(db, current_user.id, tests=1)
+
+    # Если партнер уже прошел тест, создаем (или обновляем) общий результат в той же транзакции
+    shared_result = None
+    if partner is not None:
+        shared_result = scorer.shared_result(answer_dicts, partner.answers, score, partner.score)
+        shared_result["created_at"] = await upsert_shared_result(
+            db, couple_id=current_user.couple_id, test_id=test_id, **shared_result
         )
-
-        db.add(shared_result)
-        db.commit()
+        compatibility = shared_result["compatibility_percentage"]
+        if partner.shared_compatibility is None:
+            await bump_couple_stats(db, current_user.couple_id, shared_tests=1, compatibility=compatibility)
+        else:
+            await bump_couple_stats(
+                db, current_user.couple_id, compatibility=compatibility - partner.shared_compatibility
+            )
+
+    await db.commit()
+
+    if shared_result:
+        await event_bus.publish(couple_channel(current_user.couple_id), {
+            "type": "shared_result",
+            "test_id": test_id,
+            "test_title": test.title,
+            "compatibility_percentage": shared_result["compatibility_percentage"],
+            "combined_score": shared_result["combined_score"],
+            "created_at": shared_result["created_at"].isoformat()
+        })
 
     return {
         "score": score,
@@ -595,25 +865,41 @@ async def submit_test(
 
 @app.get("/tests/results")
 async def get_test_results(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        claims: TokenClaims = Depends(get_current_claims),
+        db: AsyncSession = Depends(get_db)
 ):
-    # Личные результаты
-    personal_results = db.query(TestResult).filter(
-        TestResult.user_id == current_user.id
-    ).all()
+    # Личные результаты (один запрос с JOIN, только нужные колонки)
+    personal_results = (await db.execute(
+        select(
+            TestVersion.title,
+            TestResult.score,
+            TestResult.interpretation,
+            TestResult.completed_at
+        )
+        .join(TestSession, TestResult.test_id == TestSession.id)
+        .join(TestVersion, TestSession.test_version_id == TestVersion.id)
+        .where(TestResult.user_id == claims.user_id)
+    )).all()
 
     # Общие результаты пары
     shared_results = []
-    if current_user.couple_id:
-        shared_results = db.query(SharedTestResult).filter(
-            SharedTestResult.couple_id == current_user.couple_id
-        ).all()
-
-    return {
+    if claims.couple_id:
+        shared_results = (await db.execute(
+            select(
+                TestVersion.title,
+                SharedTestResult.compatibility_percentage,
+                SharedTestResult.combined_score,
+                SharedTestResult.created_at
+            )
+            .join(TestSession, SharedTestResult.test_id == TestSession.id)
+            .join(TestVersion, TestSession.test_version_id == TestVersion.id)
+            .where(SharedTestResult.couple_id == claims.couple_id)
+        )).all()
+
+    return json_response({
         "personal": [
             {
-                "test_title": result.test.title,
+                "test_title": result.title,
                 "score": result.score,
                 "interpretation": result.interpretation,
                 "completed_at": result.completed_at
@@ -622,23 +908,23 @@ async def get_test_results(
         ],
         "shared": [
             {
-                "test_title": result.test.title,
+                "test_title": result.title,
                 "compatibility_percentage": result.compatibility_percentage,
                 "combined_score": result.combined_score,
                 "created_at": result.created_at
             }
             for result in shared_results
         ]
-    }
+    })
 
 
 # ==================== Сообщения ====================
 
-@app.post("/messages/send")
+@app.post("/messages/send", dependencies=[Depends(admission("messages", "writes"))])
 async def send_message(
         message_data: LoveMessageCreate,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     if not current_user.couple_id:
         raise HTTPException(status_code=400, detail="Нужно быть в паре")
@@ -651,94 +937,425 @@ async def send_message(
     )
 
     db.add(message)
-    db.commit()
+    await bump_couple_stats(db, current_user.couple_id, messages=1)
+    await db.commit()
+
+    await event_bus.publish(couple_channel(current_user.couple_id), {
+        "type": "message",
+        "id": message.id,
+        "user_id": message.user_id,
+        "username": "Аноним" if message.is_anonymous else current_user.username,
+        "message": message.message,
+        "created_at": message.created_at.isoformat(),
+        "cursor": encode_message_cursor(message.created_at, message.id)
+    })
 
     return {"message": "Сообщение отправлено", "message_id": message.id}
 
 
+def encode_message_cursor(created_at: datetime, message_id: int) -> str:
+    """Непрозрачный курсор для keyset пагинации по (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_message_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
 @app.get("/messages")
 async def get_messages(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        before: Optional[str] = Query(None, description="Курсор: сообщения старше указанного"),
+        after: Optional[str] = Query(None, description="Курсор: только новые сообщения"),
+        limit: int = Query(50, ge=1, le=100),
+        claims: TokenClaims = Depends(get_current_claims),
+        db: AsyncSession = Depends(get_db)
 ):
-    if not current_user.couple_id:
-        return []
+    """
+    Сообщения пары, новые первыми. Курсоры передаются в заголовках:
+    X-Next-Cursor - для ?before= (следующая страница истории),
+    X-Latest-Cursor - для ?after= (получить только новые сообщения).
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Укажите только before или after")
+
+    if not claims.couple_id:
+        return json_response([])
+
+    query = messages_query(claims.couple_id)
+    position = tuple_(LoveMessage.created_at, LoveMessage.id)
+
+    if after:
+        # Новые сообщения после курсора: берем ближайшие к курсору и разворачиваем
+        query = query.where(position > tuple_(*decode_message_cursor(after)))
+        query = query.order_by(LoveMessage.created_at.asc(), LoveMessage.id.asc()).limit(limit)
+        messages = list(reversed((await db.execute(query)).all()))
+    else:
+        if before:
+            query = query.where(position < tuple_(*decode_message_cursor(before)))
+        query = query.order_by(LoveMessage.created_at.desc(), LoveMessage.id.desc()).limit(limit)
+        messages = (await db.execute(query)).all()
+
+    headers = {}
+    if messages:
+        headers["X-Latest-Cursor"] = encode_message_cursor(messages[0].created_at, messages[0].id)
+        if len(messages) == limit and not after:
+            headers["X-Next-Cursor"] = encode_message_cursor(messages[-1].created_at, messages[-1].id)
+    elif after:
+        headers["X-Latest-Cursor"] = after
+
+    return json_response([message_item(msg, claims.user_id) for msg in messages], headers=headers)
+
+
+def messages_query(couple_id: int):
+    # Один запрос с JOIN вместо ленивой загрузки msg.user для каждой строки
+    return (
+        select(
+            LoveMessage.id,
+            LoveMessage.user_id,
+            LoveMessage.message,
+            LoveMessage.is_anonymous,
+            LoveMessage.created_at,
+            User.username
+        )
+        .join(User, LoveMessage.user_id == User.id)
+        .where(LoveMessage.couple_id == couple_id)
+    )
 
-    messages = db.query(LoveMessage).filter(
-        LoveMessage.couple_id == current_user.couple_id
-    ).order_by(LoveMessage.created_at.desc()).limit(50).all()
 
-    return [
-        {
-            "id": msg.id,
-            "username": "Аноним" if msg.is_anonymous else msg.user.username,
-            "message": msg.message,
-            "created_at": msg.created_at,
-            "is_yours": msg.user_id == current_user.id
-        }
-        for msg in messages
-    ]
+def message_item(msg, user_id: int) -> dict:
+    return {
+        "id": msg.id,
+        "username": "Аноним" if msg.is_anonymous else msg.username,
+        "message": msg.message,
+        "created_at": msg.created_at,
+        "is_yours": msg.user_id == user_id
+    }
+
+
+# ==================== Realtime ====================
+
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def event_for_user(event: dict, user_id: int) -> dict:
+    """Событие шины в формате клиента (is_yours зависит от получателя)"""
+    if event.get("type") == "message":
+        event = {**event, "is_yours": event["user_id"] == user_id}
+        event.pop("user_id")
+    return event
+
+
+async def claims_for_stream(token: str) -> Optional[TokenClaims]:
+    """Браузер не передает Authorization в WebSocket/EventSource, поэтому токен приходит в ?token="""
+    try:
+        claims = tokens.verify_access_token(token)
+        if claims.couple_id is None:
+            async with AsyncSessionLocal() as db:
+                claims = await with_fresh_couple(claims, db)
+    except (tokens.InvalidToken, HTTPException):
+        return None
+    return claims if claims.couple_id else None
+
+
+@app.websocket("/ws/couple")
+async def couple_websocket(websocket: WebSocket, token: str = Query(...)):
+    """Новые сообщения и общие результаты пары в реальном времени"""
+    claims = await claims_for_stream(token)
+    if claims is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    async with event_bus.subscribe(couple_channel(claims.couple_id)) as subscription:
+        async def forward_events():
+            while True:
+                event = await subscription.get()
+                await websocket.send_json(event_for_user(event, claims.user_id))
+
+        async def wait_disconnect():
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+
+        tasks = [asyncio.create_task(forward_events()), asyncio.create_task(wait_disconnect())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+@app.get("/events/couple")
+async def couple_events(request: Request, token: str = Query(...)):
+    """SSE вариант /ws/couple для клиентов без WebSocket"""
+    claims = await claims_for_stream(token)
+    if claims is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+
+    async def stream():
+        async with event_bus.subscribe(couple_channel(claims.couple_id)) as subscription:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                event = event_for_user(event, claims.user_id)
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # ==================== Статистика ====================
 
 @app.get("/stats")
 async def get_couple_stats(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        claims: TokenClaims = Depends(get_current_claims),
+        db: AsyncSession = Depends(get_db)
 ):
-    if not current_user.couple_id:
+    if not claims.couple_id:
         raise HTTPException(status_code=400, detail="Нужно быть в паре")
 
-    # Количество пройденных тестов
-    test_count = db.query(TestResult).filter(
-        TestResult.user_id == current_user.id
-    ).count()
-
-    # Средняя совместимость
-    shared_results = db.query(SharedTestResult).filter(
-        SharedTestResult.couple_id == current_user.couple_id
-    ).all()
+    stats = await load_couple_stats(db, claims.user_id, claims.couple_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Пара не найдена")
+    return json_response(stats)
+
+
+async def load_couple_stats(db: AsyncSession, user_id: int, couple_id: int) -> Optional[dict]:
+    """Статистика пары для /stats и /dashboard (None - пары нет)"""
+    # Одна строка: пара + ее счетчики + счетчики пользователя + имя партнера
+    Partner = aliased(User)
+    stats_query = (
+        select(
+            Couple.created_at,
+            CoupleStats.message_count,
+            CoupleStats.shared_test_count,
+            CoupleStats.compatibility_total,
+            UserStats.test_count,
+            Partner.username.label("partner_name")
+        )
+        .select_from(Couple)
+        .outerjoin(CoupleStats, CoupleStats.couple_id == Couple.id)
+        .outerjoin(UserStats, UserStats.user_id == user_id)
+        .outerjoin(Partner, (Partner.couple_id == Couple.id) & (Partner.id != user_id))
+        .where(Couple.id == couple_id)
+        .limit(1)
+    )
+    row = (await db.execute(stats_query)).first()
+    if row is None:
+        return None
+
+    # Строки счетчиков еще нет (пара или пользователь без сообщений и тестов):
+    # считаем по таблицам без записи - GET только читает, строку создаст bump_*_stats
+    couple_stats, user_stats = row, row
+    if row.message_count is None:
+        couple_stats = await compute_couple_stats(db, couple_id)
+    if row.test_count is None:
+        user_stats = await compute_user_stats(db, user_id)
 
     avg_compatibility = 0
-    if shared_results:
-        avg_compatibility = sum(r.compatibility_percentage for r in shared_results) / len(shared_results)
+    if couple_stats.shared_test_count:
+        avg_compatibility = couple_stats.compatibility_total / couple_stats.shared_test_count
 
-    # Количество сообщений
-    message_count = db.query(LoveMessage).filter(
-        LoveMessage.couple_id == current_user.couple_id
-    ).count()
+    return {
+        "test_count": user_stats.test_count,
+        "avg_compatibility": round(avg_compatibility, 1),
+        "message_count": couple_stats.message_count,
+        "partner_name": row.partner_name or "Ожидание партнера",
+        "together_since": row.created_at
+    }
 
-    # Партнер
-    partner = db.query(User).filter(
-        User.couple_id == current_user.couple_id,
-        User.id != current_user.id
-    ).first()
 
-    partner_name = partner.username if partner else "Ожидание партнера"
+# ==================== Dashboard ====================
 
-    return {
-        "test_count": test_count,
-        "avg_compatibility": round(avg_compatibility, 1),
-        "message_count": message_count,
-        "partner_name": partner_name,
-        "together_since": current_user.couple.created_at if current_user.couple else None
+DASHBOARD_MESSAGES = 5
+DASHBOARD_PENDING_TESTS = 5
+
+
+async def load_pending_tests(db: AsyncSession, user_id: int, couple_id: int, limit: int) -> list:
+    """Прохождения пары, на которые пользователь еще не ответил"""
+    answered = select(TestResult.id).where(TestResult.test_id == TestSession.id, TestResult.user_id == user_id)
+    partner_answered = select(TestResult.id).where(TestResult.test_id == TestSession.id, TestResult.user_id != user_id)
+    rows = (await db.execute(
+        select(
+            TestSession.id,
+            TestVersion.title,
+            TestSession.created_by,
+            TestSession.created_at,
+            partner_answered.exists().label("partner_completed")
+        )
+        .join(TestVersion, TestSession.test_version_id == TestVersion.id)
+        .where(TestSession.couple_id == couple_id, ~answered.exists())
+        .order_by(TestSession.created_at.desc(), TestSession.id.desc())
+        .limit(limit)
+    )).all()
+    return [
+        {
+            "test_id": row.id,
+            "title": row.title,
+            "started_by_you": row.created_by == user_id,
+            "partner_completed": bool(row.partner_completed),
+            "created_at": row.created_at
+        }
+        for row in rows
+    ]
+
+
+@app.get("/dashboard")
+async def get_dashboard(
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Данные первого экрана одним запросом: профиль, пара, статистика, последние сообщения, незавершенные тесты"""
+    dashboard = {
+        "profile": user_serializer.to_dict(current_user),
+        "couple": None,
+        "stats": None,
+        "messages": [],
+        "pending_tests": []
     }
+    couple_id = current_user.couple_id
+    if not couple_id:
+        return json_response(dashboard)
+
+    # Кэш пары (Redis или память) читается параллельно с SQL; сами SQL запросы идут
+    # последовательно: у одной AsyncSession не может быть двух запросов одновременно
+    cached_couple, dashboard["stats"] = await asyncio.gather(
+        couple_cache.get(couple_id),
+        load_couple_stats(db, current_user.id, couple_id)
+    )
+    if cached_couple is None:
+        cached_couple = await build_couple_response(db, couple_id)
+        await couple_cache.set(couple_id, cached_couple)
+    dashboard["couple"] = loads(cached_couple["body"])
+
+    messages = (await db.execute(
+        messages_query(couple_id)
+        .order_by(LoveMessage.created_at.desc(), LoveMessage.id.desc())
+        .limit(DASHBOARD_MESSAGES)
+    )).all()
+    dashboard["messages"] = [message_item(msg, current_user.id) for msg in messages]
+    dashboard["pending_tests"] = await load_pending_tests(db, current_user.id, couple_id, DASHBOARD_PENDING_TESTS)
+
+    return json_response(dashboard)
+
+
+# ==================== Медиа ====================
+
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request):
+    """Загруженные файлы: ETag/304, Range, immutable кэш для файлов с хэшем в имени"""
+    return await media_response(request, UPLOAD_DIR, file_path)
 
 
 # Health check
 @app.get("/health")
 async def health_check():
+    """Liveness: процесс жив и отвечает (без обращения к БД)"""
     return {"status": "healthy", "service": "Love Application"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: каталог загружен, пул прогрет и не исчерпан, БД отвечает"""
+    problems = []
+    if not test_catalog.tests:
+        problems.append("каталог тестов не загружен")
+    if not startup_state["prewarm_done"]:
+        problems.append("пул соединений прогревается")
+    if pool_exhausted():
+        # Проверочный запрос ждал бы свободное соединение pool_timeout секунд
+        problems.append("все соединения пула заняты")
+    else:
+        db_error = await check_database()
+        if db_error:
+            problems.append(f"БД недоступна: {db_error}")
+
+    pool = async_pool_metrics.snapshot()
+    pool.pop("wait_seconds")
+    return json_response(
+        {
+            "status": "not_ready" if problems else "ready",
+            "problems": problems,
+            "pool": pool,
+            "startup": startup_state
+        },
+        status_code=503 if problems else 200
+    )
+
+
+@app.get("/debug/cache-stats")
+async def debug_cache_stats():
+    """Статистика кэшей (попадания/промахи)"""
+    return {"users": user_cache.stats(), "couples": couple_cache.stats(), "tokens": tokens.stats()}
+
+
+def render_cache_metrics() -> list:
+    caches = {"users": user_cache.stats(), "couples": couple_cache.stats(), "tokens": tokens.stats()}
+    lines = []
+    for name, kind, key in (
+        ("cache_hits_total", "counter", "hits"),
+        ("cache_misses_total", "counter", "misses"),
+        ("cache_evictions_total", "counter", "evictions"),
+        ("cache_size", "gauge", "size"),
+    ):
+        values = [(cache, stats[key]) for cache, stats in caches.items() if stats[key] is not None]
+        if values:
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f'{name}{{cache="{cache}"}} {value}' for cache, value in values]
+    return lines
+
+
+registry.add_collector(render_cache_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/sql-traces")
+async def debug_sql_traces(limit: int = Query(20, ge=1, le=100)):
+    """Последние выборочные трассы SQL (SQL_PROFILE=true)"""
+    if not SQL_PROFILE:
+        raise HTTPException(status_code=404, detail="Профилирование SQL выключено (SQL_PROFILE)")
+    return list(recent_traces)[-limit:]
+
+
+@app.get("/debug/pool-stats")
+async def debug_pool_stats():
+    """Пулы соединений: выдано, overflow, гистограмма ожидания соединения"""
+    return {
+        "mode": DB_POOL_MODE,
+        "async": async_pool_metrics.snapshot(),
+        "sync": sync_pool_metrics.snapshot(),
+        "password_hashing": passwords.stats(),
+        "admission": ratelimit.stats()
+    }
+
+
 @app.get("/debug/db-info")
-async def debug_db_info(db: Session = Depends(get_db)):
+async def debug_db_info(db: AsyncSession = Depends(get_db)):
     """Информация о БД и пользователях"""
 
     # Проверка подключения
     try:
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -746,7 +1363,7 @@ async def debug_db_info(db: Session = Depends(get_db)):
     # Получаем пользователей
     users = []
     try:
-        user_records = db.query(User).all()
+        user_records = (await db.scalars(select(User))).all()
         for u in user_records:
             users.append({
                 "id": u.id,
@@ -0,0 +1,157 @@
+# media.py
+import os
+import re
+from email.utils import formatdate
+from typing import Optional
+
+from fastapi import Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, FileResponse, StreamingResponse
+
+from compression import parse_accept_encoding
+
+# Файлы, названные по sha256 содержимого (см. avatars.py), никогда не меняются
+CONTENT_ADDRESSED = re.compile(r"^(?P<digest>[0-9a-f]{64})_\d+\.\w+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+MUTABLE_CACHE = "public, max-age=300, must-revalidate"
+
+# Предсжатые варианты рядом с файлом: avatar.svg.br, avatar.svg.gz
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+RANGE_CHUNK = 64 * 1024
+
+MEDIA_TYPES = {
+    ".webp": "image/webp",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+}
+
+
+def resolve_media_path(root: str, relative_path: str) -> str:
+    """Путь внутри root; ../ и симлинки наружу дают 404"""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    return path
+
+
+def make_etag(path: str, stat_result: os.stat_result) -> str:
+    match = CONTENT_ADDRESSED.match(os.path.basename(path))
+    if match:
+        # Имя = хэш содержимого, поэтому ETag строгий
+        return f'"{match.group("digest")[:32]}-{stat_result.st_size:x}"'
+    return f'W/"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    weak = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == weak:
+            return True
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[tuple]:
+    """Один диапазон bytes=start-end; для остальных вариантов отдаем файл целиком"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+async def iter_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        await run_in_threadpool(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(RANGE_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def pick_precompressed(request: Request, path: str) -> Optional[tuple]:
+    """Предсжатый вариант с наибольшим q (q=0 - кодировка запрещена); при равном q - br"""
+    accepted = parse_accept_encoding(request.headers.get("accept-encoding", ""))
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding, suffix in PRECOMPRESSED:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q and os.path.isfile(path + suffix):
+            best, best_q = (encoding, path + suffix), q
+    return best
+
+
+async def media_response(request: Request, root: str, relative_path: str) -> Response:
+    """Отдача загруженного файла с ETag, 304, Range и предсжатыми вариантами"""
+    path = resolve_media_path(root, relative_path)
+    media_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+    served_path = path
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE if CONTENT_ADDRESSED.match(os.path.basename(path)) else MUTABLE_CACHE,
+        "Accept-Ranges": "bytes",
+    }
+    if any(os.path.isfile(path + suffix) for _, suffix in PRECOMPRESSED):
+        headers["Vary"] = "Accept-Encoding"
+        precompressed = pick_precompressed(request, path)
+        if precompressed:
+            encoding, served_path = precompressed
+            headers["Content-Encoding"] = encoding
+            headers["Accept-Ranges"] = "none"
+
+    stat_result = os.stat(served_path)
+    etag = make_etag(path, stat_result)
+    if "Content-Encoding" in headers:
+        etag = etag[:-1] + f'-{headers["Content-Encoding"]}"'
+    headers["ETag"] = etag
+    headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and "Content-Encoding" not in headers and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, stat_result.st_size)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            if request.method == "HEAD":
+                return Response(status_code=206, headers=headers, media_type=media_type)
+            return StreamingResponse(
+                iter_file_range(served_path, start, end),
+                status_code=206,
+                headers=headers,
+                media_type=media_type
+            )
+
+    return FileResponse(
+        served_path,
+        headers=headers,
+        media_type=media_type,
+        stat_result=stat_result
+    )
@@ -0,0 +1,264 @@
+# metrics.py
+import time
+import contextvars
+from bisect import bisect_left
+
+from starlette.routing import Match
+
+# Границы (сек) для времени ожидания/выполнения: от 1 мс до 10 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами (как histogram в Prometheus)"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Последняя ячейка - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """[(граница, число наблюдений <= границы), ...] включая +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): total
+                        for bound, total in self.cumulative()},
+        }
+
+
+# ==================== Реестр метрик ====================
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, kind: str = "counter") -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {kind}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+    def render(self, kind: str = "gauge") -> list:
+        return super().render(kind)
+
+
+class LabeledHistogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.histograms = {}
+
+    def labels(self, labels: tuple = ()) -> Histogram:
+        histogram = self.histograms.get(labels)
+        if histogram is None:
+            histogram = self.histograms[labels] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, labels: tuple, value: float):
+        self.labels(labels).observe(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, histogram in sorted(self.histograms.items()):
+            lines.extend(render_histogram(self.name, self.labelnames, labels, histogram))
+        return lines
+
+
+def render_histogram(name: str, labelnames: tuple, labels: tuple, histogram: Histogram) -> list:
+    lines = [
+        f"{name}_bucket{format_labels(labelnames + ('le',), labels + (format_value(bound),))} {total}"
+        for bound, total in histogram.cumulative()
+    ]
+    lines.append(f"{name}_sum{format_labels(labelnames, labels)} {format_value(histogram.sum)}")
+    lines.append(f"{name}_count{format_labels(labelnames, labels)} {histogram.count}")
+    return lines
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus (без внешних зависимостей)"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # Функции, возвращающие готовые строки (пулы, кэши)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP запросы по маршруту и статусу", ("method", "route", "status")
+))
+REQUEST_ERRORS = registry.register(Counter(
+    "http_request_errors_total", "Ответы 5xx и необработанные исключения", ("method", "route")
+))
+REQUEST_LATENCY = registry.register(LabeledHistogram(
+    "http_request_duration_seconds", "Время обработки запроса", ("method", "route")
+))
+IN_PROGRESS = registry.register(Gauge(
+    "http_requests_in_progress", "Запросы в обработке", ("method",)
+))
+DB_QUERIES = registry.register(Counter(
+    "db_queries_total", "SQL запросы по маршруту", ("route",)
+))
+DB_QUERY_TIME = registry.register(Counter(
+    "db_query_seconds_total", "Суммарное время SQL запросов по маршруту", ("route",)
+))
+DB_QUERIES_PER_REQUEST = registry.register(LabeledHistogram(
+    "db_queries_per_request", "Число SQL запросов на один HTTP запрос", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50)
+))
+DB_STATEMENT_LATENCY = registry.register(LabeledHistogram(
+    "db_statement_duration_seconds", "Время одного SQL запроса"
+))
+
+RATE_LIMIT_DECISIONS = registry.register(Counter(
+    "rate_limit_decisions_total", "Решения token bucket лимитов (allowed, limited, error)", ("limiter", "decision")
+))
+CONCURRENCY_DECISIONS = registry.register(Counter(
+    "concurrency_limit_decisions_total", "Решения лимитов конкурентности (admitted, shed)", ("limiter", "decision")
+))
+CONCURRENCY_IN_FLIGHT = registry.register(Gauge(
+    "concurrency_limit_in_flight", "Запросы, занимающие слот лимита конкурентности", ("limiter",)
+))
+
+# [число запросов, секунды] для SQL текущего HTTP запроса
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def record_query(duration: float):
+    """Вызывается из событий движков SQLAlchemy (database.py)"""
+    DB_STATEMENT_LATENCY.observe((), duration)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += duration
+
+
+# ==================== Middleware ====================
+
+_routes_by_endpoint = {}
+
+
+def route_template(scope) -> str:
+    """Шаблон пути (/tests/{test_id}/submit), чтобы число меток не росло с id"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if not _routes_by_endpoint:
+        for candidate in scope["app"].routes:
+            if hasattr(candidate, "endpoint"):
+                _routes_by_endpoint.setdefault(candidate.endpoint, []).append(candidate)
+    candidates = _routes_by_endpoint.get(endpoint, ())
+    if len(candidates) == 1:
+        return candidates[0].path
+    for candidate in candidates:
+        if candidate.matches(scope)[0] == Match.FULL:
+            return candidate.path
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware: без BaseHTTPMiddleware и лишних задач на запрос"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        db_stats = [0, 0.0]
+        token = _request_db.set(db_stats)
+        IN_PROGRESS.inc((method,))
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            IN_PROGRESS.dec((method,))
+            _request_db.reset(token)
+            route = route_template(scope)
+            REQUESTS.inc((method, route, str(status_code)))
+            REQUEST_LATENCY.observe((method, route), duration)
+            if status_code >= 500:
+                REQUEST_ERRORS.inc((method, route))
+            DB_QUERIES.inc((route,), db_stats[0])
+            DB_QUERY_TIME.inc((route,), db_stats[1])
+            DB_QUERIES_PER_REQUEST.observe((route,), db_stats[0])
@@ -0,0 +1,126 @@
+"""initial schema
+
+Схема, которую раньше создавал Base.metadata.create_all при импорте main.py.
+Уже существующие таблицы пропускаются, поэтому миграция применяется и к
+базам, созданным до появления Alembic.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "couples" not in existing:
+        op.create_table(
+            "couples",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("couple_code", sa.String(10), nullable=False, unique=True),
+            sa.Column("relationship_name", sa.String(100)),
+            sa.Column("avatar_url", sa.String(500), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("is_active", sa.Boolean()),
+        )
+        op.create_index("ix_couples_id", "couples", ["id"])
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(255), nullable=False),
+            sa.Column("username", sa.String(100), nullable=False),
+            sa.Column("password_hash", sa.String(255), nullable=False),
+            sa.Column("gender", sa.String(10), nullable=False),
+            sa.Column("avatar_url", sa.String(500), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=True),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "tests" not in existing:
+        op.create_table(
+            "tests",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(200), nullable=False),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.Column("category", sa.String(50), nullable=False),
+            sa.Column("questions", sa.JSON(), nullable=False),
+            sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=False),
+            sa.Column("created_by", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_tests_id", "tests", ["id"])
+
+    if "test_results" not in existing:
+        op.create_table(
+            "test_results",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("test_id", sa.Integer(), sa.ForeignKey("tests.id"), nullable=False),
+            sa.Column("answers", sa.JSON(), nullable=False),
+            sa.Column("score", sa.Integer(), nullable=False),
+            sa.Column("interpretation", sa.Text(), nullable=True),
+            sa.Column("completed_at", sa.DateTime()),
+        )
+        op.create_index("ix_test_results_id", "test_results", ["id"])
+
+    if "shared_test_results" not in existing:
+        op.create_table(
+            "shared_test_results",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=False),
+            sa.Column("test_id", sa.Integer(), sa.ForeignKey("tests.id"), nullable=False),
+            sa.Column("combined_score", sa.Integer(), nullable=False),
+            sa.Column("compatibility_percentage", sa.Integer(), nullable=False),
+            sa.Column("insights", sa.JSON(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_shared_test_results_id", "shared_test_results", ["id"])
+
+    if "love_messages" not in existing:
+        op.create_table(
+            "love_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=False),
+            sa.Column("message", sa.Text(), nullable=False),
+            sa.Column("is_anonymous", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_love_messages_id", "love_messages", ["id"])
+
+    if "couple_stats" not in existing:
+        op.create_table(
+            "couple_stats",
+            sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), primary_key=True),
+            sa.Column("message_count", sa.Integer(), nullable=False),
+            sa.Column("shared_test_count", sa.Integer(), nullable=False),
+            sa.Column("compatibility_total", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    if "user_stats" not in existing:
+        op.create_table(
+            "user_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("test_count", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+
+def downgrade():
+    for table in ("user_stats", "couple_stats", "love_messages", "shared_test_results",
+                  "test_results", "tests", "users", "couples"):
+        op.drop_table(table)
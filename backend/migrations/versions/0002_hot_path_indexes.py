@@ -0,0 +1,38 @@
+"""hot path indexes
+
+Индексы под фильтры горячих эндпоинтов (/messages, /stats, /tests/results,
+submit_test, /couples/my). couples.couple_code уже покрыт уникальным индексом.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_love_messages_couple_created",
+        "love_messages",
+        ["couple_id", sa.text("created_at DESC")],
+    )
+    op.create_index("ix_test_results_user_id", "test_results", ["user_id"])
+    op.create_index("ix_test_results_test_user", "test_results", ["test_id", "user_id"])
+    op.create_index("ix_shared_test_results_couple_id", "shared_test_results", ["couple_id"])
+    op.create_index("ix_users_couple_id", "users", ["couple_id"])
+
+
+def downgrade():
+    op.drop_index("ix_users_couple_id", table_name="users")
+    op.drop_index("ix_shared_test_results_couple_id", table_name="shared_test_results")
+    op.drop_index("ix_test_results_test_user", table_name="test_results")
+    op.drop_index("ix_test_results_user_id", table_name="test_results")
+    op.drop_index("ix_love_messages_couple_created", table_name="love_messages")
@@ -0,0 +1,36 @@
+"""love_messages keyset index
+
+Keyset пагинация /messages идет по (created_at, id), поэтому id добавлен в
+индекс ленты сообщений, чтобы одинаковые created_at не требовали сортировки.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_love_messages_couple_created_id",
+        "love_messages",
+        ["couple_id", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+    op.drop_index("ix_love_messages_couple_created", table_name="love_messages")
+
+
+def downgrade():
+    op.create_index(
+        "ix_love_messages_couple_created",
+        "love_messages",
+        ["couple_id", sa.text("created_at DESC")],
+    )
+    op.drop_index("ix_love_messages_couple_created_id", table_name="love_messages")
@@ -0,0 +1,213 @@
+"""test versions and sessions
+
+Раньше /tests/start создавал строку tests с полной копией вопросов (причем
+json.dumps внутри JSON колонки, как и answers/insights результатов). Теперь
+вопросы хранятся один раз в test_versions, а на каждое прохождение создается
+легкая строка test_sessions.
+Существующие строки tests переносятся в test_sessions с теми же id, поэтому
+test_results.test_id и shared_test_results.test_id остаются валидными и только
+перенаправляются на новую таблицу.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:30:00
+
+"""
+import json
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+JSONType = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+NAMING = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+RESULT_TABLES = ("test_results", "shared_test_results")
+CHUNK = 5000
+
+legacy_tests = sa.table(
+    "tests",
+    sa.column("id", sa.Integer),
+    sa.column("title", sa.String),
+    sa.column("description", sa.Text),
+    sa.column("category", sa.String),
+    sa.column("questions", sa.JSON),
+    sa.column("couple_id", sa.Integer),
+    sa.column("created_by", sa.Integer),
+    sa.column("created_at", sa.DateTime),
+)
+test_versions = sa.table(
+    "test_versions",
+    sa.column("id", sa.Integer),
+    sa.column("content_hash", sa.String),
+    sa.column("title", sa.String),
+    sa.column("description", sa.Text),
+    sa.column("category", sa.String),
+    sa.column("questions", JSONType),
+    sa.column("created_at", sa.DateTime),
+)
+test_sessions = sa.table(
+    "test_sessions",
+    sa.column("id", sa.Integer),
+    sa.column("test_version_id", sa.Integer),
+    sa.column("couple_id", sa.Integer),
+    sa.column("created_by", sa.Integer),
+    sa.column("created_at", sa.DateTime),
+)
+
+
+def content_hash(content: dict) -> str:
+    # Та же формула, что catalog.content_hash
+    return hashlib.sha256(
+        json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def retarget_test_fk(table: str, from_table: str, to_table: str):
+    bind = op.get_bind()
+    name = next(
+        (fk["name"] for fk in sa.inspect(bind).get_foreign_keys(table) if fk["referred_table"] == from_table),
+        None
+    )
+    # В SQLite FK безымянный, batch режим называет его по NAMING
+    name = name or f"fk_{table}_test_id_{from_table}"
+    with op.batch_alter_table(table, naming_convention=NAMING) as batch:
+        batch.drop_constraint(name, type_="foreignkey")
+        batch.create_foreign_key(f"fk_{table}_test_id_{to_table}", to_table, ["test_id"], ["id"])
+
+
+def decode_legacy_json(table: str, column: str):
+    """Старые строки хранили json.dumps(...) внутри JSON колонки - сохраняем как обычный JSON"""
+    bind = op.get_bind()
+    rows_table = sa.table(table, sa.column("id", sa.Integer), sa.column(column, sa.JSON))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(rows_table).where(rows_table.c.id > last_id).order_by(rows_table.c.id).limit(CHUNK)
+        ).all()
+        if not rows:
+            break
+        updates = [
+            {"row_id": row[0], "value": json.loads(row[1])}
+            for row in rows if isinstance(row[1], str)
+        ]
+        if updates:
+            bind.execute(
+                rows_table.update()
+                .where(rows_table.c.id == sa.bindparam("row_id"))
+                .values({column: sa.bindparam("value")}),
+                updates
+            )
+        last_id = rows[-1][0]
+
+
+def reset_sequence(table: str):
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        bind.execute(sa.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+        ))
+
+
+def upgrade():
+    op.create_table(
+        "test_versions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("catalog_id", sa.Integer(), nullable=True),
+        sa.Column("slug", sa.String(100), nullable=True),
+        sa.Column("content_hash", sa.String(64), nullable=False, unique=True),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("category", sa.String(50), nullable=False),
+        sa.Column("questions", JSONType, nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "test_sessions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("test_version_id", sa.Integer(), sa.ForeignKey("test_versions.id"), nullable=False),
+        sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=False),
+        sa.Column("created_by", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+
+    # Перенос tests -> test_versions (по содержимому) + test_sessions (те же id)
+    bind = op.get_bind()
+    version_ids = {}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(legacy_tests).where(legacy_tests.c.id > last_id).order_by(legacy_tests.c.id).limit(CHUNK)
+        ).mappings().all()
+        if not rows:
+            break
+        sessions = []
+        for row in rows:
+            questions = row["questions"]
+            if isinstance(questions, str):
+                questions = json.loads(questions)  # Двойное кодирование в старых строках
+            content = {
+                "title": row["title"],
+                "description": row["description"],
+                "category": row["category"],
+                "questions": questions,
+            }
+            version_hash = content_hash(content)
+            if version_hash not in version_ids:
+                bind.execute(test_versions.insert().values(
+                    content_hash=version_hash, created_at=row["created_at"], **content
+                ))
+                version_ids[version_hash] = bind.execute(
+                    sa.select(test_versions.c.id).where(test_versions.c.content_hash == version_hash)
+                ).scalar_one()
+            sessions.append({
+                "id": row["id"],
+                "test_version_id": version_ids[version_hash],
+                "couple_id": row["couple_id"],
+                "created_by": row["created_by"],
+                "created_at": row["created_at"],
+            })
+        op.bulk_insert(test_sessions, sessions)
+        last_id = rows[-1]["id"]
+    reset_sequence("test_sessions")
+
+    for table in RESULT_TABLES:
+        retarget_test_fk(table, "tests", "test_sessions")
+    op.drop_index("ix_tests_id", table_name="tests")
+    op.drop_table("tests")
+
+    decode_legacy_json("test_results", "answers")
+    decode_legacy_json("shared_test_results", "insights")
+
+
+def downgrade():
+    op.create_table(
+        "tests",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("category", sa.String(50), nullable=False),
+        sa.Column("questions", sa.JSON(), nullable=False),
+        sa.Column("couple_id", sa.Integer(), sa.ForeignKey("couples.id"), nullable=False),
+        sa.Column("created_by", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_tests_id", "tests", ["id"])
+    questions = "v.questions::json" if op.get_bind().dialect.name == "postgresql" else "v.questions"
+    op.execute(
+        "INSERT INTO tests (id, title, description, category, questions, couple_id, created_by, created_at) "
+        f"SELECT s.id, v.title, v.description, v.category, {questions}, s.couple_id, s.created_by, s.created_at "
+        "FROM test_sessions s JOIN test_versions v ON v.id = s.test_version_id"
+    )
+    reset_sequence("tests")
+
+    for table in RESULT_TABLES:
+        retarget_test_fk(table, "test_sessions", "tests")
+    op.drop_table("test_sessions")
+    op.drop_table("test_versions")
@@ -0,0 +1,59 @@
+"""shared_test_results unique (couple_id, test_id)
+
+submit_test создает общий результат через INSERT ... ON CONFLICT, для этого
+нужен уникальный индекс по (couple_id, test_id). Дубликаты, появившиеся при
+одновременной отправке ответов партнерами, удаляются (остается последний),
+счетчики couple_stats этих пар пересчитываются.
+Индекс ix_shared_test_results_couple_id больше не нужен: couple_id - первая
+колонка нового индекса.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:50:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    duplicated_couples = [row[0] for row in bind.execute(sa.text(
+        "SELECT DISTINCT couple_id FROM shared_test_results "
+        "GROUP BY couple_id, test_id HAVING COUNT(*) > 1"
+    ))]
+    if duplicated_couples:
+        op.execute(
+            "DELETE FROM shared_test_results WHERE id NOT IN ("
+            "SELECT MAX(id) FROM shared_test_results GROUP BY couple_id, test_id)"
+        )
+        bind.execute(
+            sa.text(
+                "UPDATE couple_stats SET "
+                "shared_test_count = (SELECT COUNT(*) FROM shared_test_results s "
+                "WHERE s.couple_id = couple_stats.couple_id), "
+                "compatibility_total = (SELECT COALESCE(SUM(s.compatibility_percentage), 0) "
+                "FROM shared_test_results s WHERE s.couple_id = couple_stats.couple_id) "
+                "WHERE couple_id IN :couple_ids"
+            ).bindparams(sa.bindparam("couple_ids", expanding=True)),
+            {"couple_ids": duplicated_couples}
+        )
+
+    op.create_index(
+        "uq_shared_test_results_couple_test",
+        "shared_test_results",
+        ["couple_id", "test_id"],
+        unique=True,
+    )
+    op.drop_index("ix_shared_test_results_couple_id", table_name="shared_test_results")
+
+
+def downgrade():
+    op.create_index("ix_shared_test_results_couple_id", "shared_test_results", ["couple_id"])
+    op.drop_index("uq_shared_test_results_couple_test", table_name="shared_test_results")
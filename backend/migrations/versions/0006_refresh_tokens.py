@@ -0,0 +1,40 @@
+"""refresh tokens
+
+Access токены стали короткими (ACCESS_TOKEN_EXPIRE_MINUTES), продление -
+через одноразовые refresh токены. В таблице хранится только sha256 токена;
+family объединяет цепочку ротаций одного входа, чтобы при повторном
+использовании старого токена отозвать всю цепочку.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 03:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "refresh_tokens",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("family", sa.String(32), nullable=False),
+        sa.Column("token_hash", sa.String(64), nullable=False, unique=True),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("used_at", sa.DateTime(), nullable=True),
+        sa.Column("revoked_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_refresh_tokens_family", "refresh_tokens", ["family"])
+
+
+def downgrade():
+    op.drop_index("ix_refresh_tokens_family", table_name="refresh_tokens")
+    op.drop_table("refresh_tokens")
@@ -0,0 +1,26 @@
+"""test_sessions (couple_id, created_at) index
+
+/dashboard показывает последние прохождения пары, на которые пользователь еще
+не ответил: WHERE couple_id = ? ORDER BY created_at DESC. Без индекса запрос
+читает всю таблицу test_sessions.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 04:00:00
+
+"""
+from alembic import op
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_test_sessions_couple_created", "test_sessions", ["couple_id", "created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_test_sessions_couple_created", table_name="test_sessions")
@@ -0,0 +1,46 @@
+"""backfill couple_stats and user_stats
+
+Пары и пользователи, созданные до появления счетчиков, получают строки
+couple_stats/user_stats, посчитанные по исходным таблицам. После этого /stats
+только читает счетчики, а bump_*_stats создает недостающую строку через
+INSERT ... ON CONFLICT DO NOTHING.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 06:00:00
+
+"""
+from alembic import op
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        INSERT INTO couple_stats (couple_id, message_count, shared_test_count, compatibility_total, updated_at)
+        SELECT c.id,
+               (SELECT COUNT(*) FROM love_messages m WHERE m.couple_id = c.id),
+               (SELECT COUNT(*) FROM shared_test_results s WHERE s.couple_id = c.id),
+               (SELECT COALESCE(SUM(s.compatibility_percentage), 0)
+                FROM shared_test_results s WHERE s.couple_id = c.id),
+               CURRENT_TIMESTAMP
+        FROM couples c
+        WHERE NOT EXISTS (SELECT 1 FROM couple_stats cs WHERE cs.couple_id = c.id)
+    """)
+    op.execute("""
+        INSERT INTO user_stats (user_id, test_count, updated_at)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM test_results r WHERE r.user_id = u.id),
+               CURRENT_TIMESTAMP
+        FROM users u
+        WHERE NOT EXISTS (SELECT 1 FROM user_stats us WHERE us.user_id = u.id)
+    """)
+
+
+def downgrade():
+    # Строки счетчиков совместимы с предыдущей ревизией
+    pass
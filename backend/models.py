@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -6,6 +7,9 @@ import os
 
 Base = declarative_base()
 
+# Нативный JSONB в PostgreSQL, обычный JSON в SQLite
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 
 class User(Base):
     __tablename__ = "users"
@@ -24,6 +28,10 @@ class User(Base):
     test_results = relationship("TestResult", back_populates="user")
     love_messages = relationship("LoveMessage", back_populates="user")
 
+    __table_args__ = (
+        Index("ix_users_couple_id", "couple_id"),  # Партнеры пары
+    )
+
 
 class Couple(Base):
     __tablename__ = "couples"
@@ -37,26 +45,47 @@ class Couple(Base):
 
     # Связи
     partners = relationship("User", back_populates="couple")
-    tests = relationship("Test", back_populates="couple")
+    test_sessions = relationship("TestSession", back_populates="couple")
     shared_results = relationship("SharedTestResult", back_populates="couple")
 
 
-class Test(Base):
-    __tablename__ = "tests"
+class TestVersion(Base):
+    """Неизменяемая версия теста из каталога (одна строка на содержимое, а не на прохождение)"""
+    __tablename__ = "test_versions"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
+    catalog_id = Column(Integer, nullable=True)  # id теста в tests_catalog
+    slug = Column(String(100), nullable=True)
+    content_hash = Column(String(64), unique=True, nullable=False)  # sha256 title/description/category/questions
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     category = Column(String(50), nullable=False)  # "love", "compatibility", "future"
-    questions = Column(JSON, nullable=False)  # Список вопросов в JSON
+    questions = Column(JSONType, nullable=False)  # Список вопросов (без двойного json.dumps)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Связи
+    sessions = relationship("TestSession", back_populates="version")
+
+
+class TestSession(Base):
+    """Прохождение теста парой: ссылка на версию теста вместо копии вопросов"""
+    __tablename__ = "test_sessions"
+
+    id = Column(Integer, primary_key=True)
+    test_version_id = Column(Integer, ForeignKey("test_versions.id"), nullable=False)
     couple_id = Column(Integer, ForeignKey("couples.id"), nullable=False)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Связи
-    couple = relationship("Couple", back_populates="tests")
-    results = relationship("TestResult", back_populates="test")
-    shared_results = relationship("SharedTestResult", back_populates="test")
+    version = relationship("TestVersion", back_populates="sessions")
+    couple = relationship("Couple", back_populates="test_sessions")
+    results = relationship("TestResult", back_populates="session")
+    shared_results = relationship("SharedTestResult", back_populates="session")
+
+    __table_args__ = (
+        Index("ix_test_sessions_couple_created", "couple_id", "created_at"),  # Незавершенные тесты пары
+    )
 
 
 class TestResult(Base):
@@ -64,7 +93,7 @@ class TestResult(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
+    test_id = Column(Integer, ForeignKey("test_sessions.id"), nullable=False)  # id прохождения (test_sessions)
     answers = Column(JSON, nullable=False)  # Ответы пользователя
     score = Column(Integer, nullable=False)
     interpretation = Column(Text, nullable=True)
@@ -72,7 +101,12 @@ class TestResult(Base):
 
     # Связи
     user = relationship("User", back_populates="test_results")
-    test = relationship("Test", back_populates="results")
+    session = relationship("TestSession", back_populates="results")
+
+    __table_args__ = (
+        Index("ix_test_results_user_id", "user_id"),  # Личные результаты
+        Index("ix_test_results_test_user", "test_id", "user_id"),  # Результат партнера по тесту
+    )
 
 
 class SharedTestResult(Base):
@@ -80,7 +114,7 @@ class SharedTestResult(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     couple_id = Column(Integer, ForeignKey("couples.id"), nullable=False)
-    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
+    test_id = Column(Integer, ForeignKey("test_sessions.id"), nullable=False)  # id прохождения (test_sessions)
     combined_score = Column(Integer, nullable=False)
     compatibility_percentage = Column(Integer, nullable=False)
     insights = Column(JSON, nullable=False)  # Общие выводы
@@ -88,7 +122,12 @@ class SharedTestResult(Base):
 
     # Связи
     couple = relationship("Couple", back_populates="shared_results")
-    test = relationship("Test", back_populates="shared_results")
+    session = relationship("TestSession", back_populates="shared_results")
+
+    __table_args__ = (
+        # Один общий результат на прохождение; цель ON CONFLICT в submit_test
+        Index("uq_shared_test_results_couple_test", "couple_id", "test_id", unique=True),
+    )
 
 
 class LoveMessage(Base):
@@ -102,4 +141,47 @@ class LoveMessage(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Связи
-    user = relationship("User", back_populates="love_messages")
\ No newline at end of file
+    user = relationship("User", back_populates="love_messages")
+
+    __table_args__ = (
+        # Лента сообщений пары: WHERE couple_id = ? ORDER BY created_at DESC, id DESC (keyset пагинация)
+        Index("ix_love_messages_couple_created_id", "couple_id", created_at.desc(), id.desc()),
+    )
+
+
+class CoupleStats(Base):
+    """Счетчики пары, обновляются в тех же транзакциях, что и исходные записи"""
+    __tablename__ = "couple_stats"
+
+    couple_id = Column(Integer, ForeignKey("couples.id"), primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    shared_test_count = Column(Integer, nullable=False, default=0)
+    compatibility_total = Column(Integer, nullable=False, default=0)  # Сумма compatibility_percentage
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserStats(Base):
+    """Счетчики пользователя (количество пройденных тестов)"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    test_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RefreshToken(Base):
+    """Refresh токены (хранится sha256); family - цепочка ротаций одного входа"""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    family = Column(String(32), nullable=False)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Токен обменян на новый (ротация)
+    revoked_at = Column(DateTime, nullable=True)  # Logout или повторное использование
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_family", "family"),  # Отзыв всей цепочки
+    )
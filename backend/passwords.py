@@ -0,0 +1,122 @@
+# passwords.py
+import os
+import hmac
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+# Схема для новых хэшей: pbkdf2_sha256 (по умолчанию) или argon2 (нужен пакет argon2-cffi)
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "pbkdf2_sha256")
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "200000"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+
+# hashlib.pbkdf2_hmac и argon2-cffi отпускают GIL, поэтому хватает потоков.
+# Отдельный пул: хэширование не занимает потоки run_in_threadpool остальных эндпоинтов
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций (включая выполняемые) может быть в пуле; сверх этого /login и /register
+# сразу отвечают 503. Ожидание в очереди не держит соединение БД, а выходят из нее запросы
+# не чаще, чем успевают воркеры, поэтому граница считается по времени ожидания:
+# 16 операций на воркер - около 1.5 с при ~100 мс на pbkdf2 (200000 раундов).
+# Отказ означает устойчивую перегрузку, а не обычный всплеск логинов
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 16)))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256", "argon2"],
+    default=PASSWORD_SCHEME,
+    deprecated="auto",
+    pbkdf2_sha256__rounds=PBKDF2_ROUNDS,
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=1,
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def is_legacy_hash(hashed_password: str) -> bool:
+    """Старые пароли: несоленый SHA-256 в hex"""
+    return len(hashed_password) == 64 and "$" not in hashed_password
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> tuple:
+    """(пароль верный, новый хэш или None); новый хэш - для старых SHA-256 и при смене стоимости"""
+    if is_legacy_hash(hashed_password):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        if hmac.compare_digest(legacy, hashed_password):
+            return True, hash_password(password)
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, hashed_password)
+    except ValueError:
+        # Неизвестный формат хэша
+        return False, None
+
+
+# Фиктивный хэш: проверка несуществующего email стоит столько же, сколько существующего
+_dummy_hash = None
+
+
+def verify_dummy(password: str) -> tuple:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("dummy-password")
+    pwd_context.verify(password, _dummy_hash)
+    return False, None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_hashing(func, *args):
+    """Выполняет func в пуле хэширования; при переполненной очереди - HashingBusy"""
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HashingBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_hashing(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: Optional[str]) -> tuple:
+    if hashed_password is None:
+        return await run_hashing(verify_dummy, password)
+    return await run_hashing(verify_password, password, hashed_password)
+
+
+def stats() -> dict:
+    return {
+        "scheme": PASSWORD_SCHEME,
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": _pending,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+    }
@@ -0,0 +1,164 @@
+# profiling.py
+import os
+import re
+import json
+import time
+import uuid
+import random
+import contextvars
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+from metrics import route_template
+
+# Профилирование SQL включается явно: SQL_PROFILE=true
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+# Доля запросов, для которых собирается полная трасса SQL (0..1)
+TRACE_SAMPLE_RATE = float(os.getenv("SQL_TRACE_SAMPLE_RATE", "0.01"))
+# Каталог для JSON трасс; без него трассы хранятся только в памяти (/debug/sql-traces)
+TRACE_DIR = os.getenv("SQL_TRACE_DIR")
+TRACE_BUFFER_SIZE = 100
+MAX_TRACE_STATEMENTS = 500
+APPLICATION_NAME = "loveapp"
+
+SAFE_TAG = re.compile(r"[^A-Za-z0-9_{}/.:-]")
+
+# Текущий HTTP запрос: {"request_id", "scope", "route", "trace"}
+_request = contextvars.ContextVar("sql_profile_request", default=None)
+recent_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+def clean_tag(value: str, limit: int = 100) -> str:
+    """Значение для SQL комментария: без */ и кавычек"""
+    return SAFE_TAG.sub("_", value)[:limit]
+
+
+def redact(parameters):
+    """Параметры без значений: только типы (в лог не попадают email, пароли, сообщения)"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} наборов параметров>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def current_route(request: dict) -> str:
+    # Маршрут известен только после роутинга, поэтому определяется при первом SQL запросе
+    if request.get("route") is None:
+        route = route_template(request["scope"])
+        if route == "unmatched":
+            return route
+        request["route"] = clean_tag(route)
+    return request["route"]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["profile_started"] = time.perf_counter()
+    request = _request.get()
+    if request is None:
+        return statement, parameters
+    # Комментарий в стиле sqlcommenter: виден в pg_stat_activity, логах Postgres и PgHero.
+    # Только маршрут: текст запроса должен повторяться, иначе asyncpg готовит (PREPARE) каждый
+    # запрос заново и кэш prepared statements бесполезен. request_id есть в логе медленных
+    # запросов, трассах и заголовке X-Request-ID
+    return f"{statement} /* route='{current_route(request)}' */", parameters
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("profile_started", None)
+    if started is None:
+        return
+    duration_ms = (time.perf_counter() - started) * 1000
+    request = _request.get()
+
+    if duration_ms >= SLOW_QUERY_MS:
+        where = f"{request['route'] or 'unmatched'} {request['request_id']}" if request else "вне запроса"
+        print(f"⚠️ Медленный SQL {duration_ms:.1f} мс [{where}]: {statement} params={redact(parameters)}")
+
+    if request and request["trace"] is not None and len(request["trace"]) < MAX_TRACE_STATEMENTS:
+        request["trace"].append({
+            "statement": statement,
+            "params": redact(parameters),
+            "duration_ms": round(duration_ms, 3),
+            "rowcount": getattr(cursor, "rowcount", None),
+        })
+
+
+def set_application_name(dbapi_connection, connection_record, connection_proxy):
+    """Postgres: application_name = маршрут, чтобы PgHero/pg_stat_activity показывали источник"""
+    request = _request.get()
+    name = f"{APPLICATION_NAME}:{current_route(request)}" if request else APPLICATION_NAME
+    cursor = dbapi_connection.cursor()
+    try:
+        # Без параметров: у psycopg2 и asyncpg разные paramstyle; clean_tag убирает кавычки
+        cursor.execute(f"SET application_name = '{name[:63]}'")
+    finally:
+        cursor.close()
+
+
+def install(engine):
+    """Подключает профилирование к движку (sync engine или async_engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", before_cursor_execute, retval=True)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    if engine.dialect.name == "postgresql":
+        event.listen(engine, "checkout", set_application_name)
+
+
+def save_trace(trace: dict):
+    recent_traces.append(trace)
+    if TRACE_DIR:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"{trace['started_at'][:19].replace(':', '-')}_{trace['request_id']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False, indent=2)
+
+
+class ProfilingMiddleware:
+    """Request id для каждого запроса (X-Request-ID) и выборочная трасса SQL"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = clean_tag(headers.get(b"x-request-id", b"").decode("latin-1"), 64) or uuid.uuid4().hex[:16]
+        sampled = headers.get(b"x-sql-trace") == b"1" or random.random() < TRACE_SAMPLE_RATE
+        request = {"request_id": request_id, "scope": scope, "route": None, "trace": [] if sampled else None}
+        token = _request.set(request)
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request.reset(token)
+            if sampled:
+                save_trace({
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": current_route(request),
+                    "status": status_code,
+                    "started_at": started_at.isoformat(),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "sql_count": len(request["trace"]),
+                    "sql_ms": round(sum(item["duration_ms"] for item in request["trace"]), 3),
+                    "statements": request["trace"],
+                })
@@ -0,0 +1,208 @@
+# ratelimit.py
+import os
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from database import pool_exhausted
+from metrics import RATE_LIMIT_DECISIONS, CONCURRENCY_DECISIONS, CONCURRENCY_IN_FLIGHT
+
+# RATE_LIMIT_ENABLED=false выключает и token bucket, и лимиты конкурентности (бенчмарки)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Сколько ключей (пользователей/IP) помнить в памяти воркера
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    pass
+
+
+def parse_rate(value: str) -> tuple:
+    """"10/60" -> (10 запросов, за 60 секунд); емкость bucket'а равна числу запросов"""
+    count, _, period = value.partition("/")
+    return int(count), float(period or 1)
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+# ==================== Хранилища bucket'ов ====================
+
+class MemoryBucketBackend:
+    """Token bucket'ы в памяти воркера: ключ -> [токены, время пополнения]"""
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Списывает cost токенов: 0 - разрешено, иначе через сколько секунд повторить"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.maxsize:
+                # Вытесняется самый давно активный ключ: его bucket почти наверняка уже полон
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rate
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+# Тот же алгоритм атомарно на стороне Redis; время - часы Redis, общие для всех воркеров
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBucketBackend:
+    """Общие bucket'ы для всех воркеров и инстансов"""
+
+    def __init__(self, url: str, prefix: str = "loveapp:ratelimit"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        # Lua number -> integer reply обрезал бы дробную часть, поэтому строка
+        return float(await self.script(keys=[f"{self.prefix}:{key}"], args=[rate, burst, cost]))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def make_bucket_backend():
+    """Redis, если задан RATE_LIMIT_REDIS_URL, иначе bucket'ы в памяти воркера"""
+    redis_url = os.getenv("RATE_LIMIT_REDIS_URL")
+    if redis_url:
+        return RedisBucketBackend(redis_url)
+    return MemoryBucketBackend()
+
+
+# ==================== Лимиты ====================
+
+class RateLimiter:
+    """Token bucket на ключ (пользователь или IP): в среднем count запросов за period, всплеск до count"""
+
+    def __init__(self, name: str, rate: str, backend):
+        self.name = name
+        self.count, self.period = parse_rate(rate)
+        self.rate = self.count / self.period
+        self.backend = backend
+
+    async def hit(self, key: str) -> float:
+        """0 - запрос разрешен, иначе Retry-After в секундах"""
+        try:
+            retry_after = await self.backend.take(f"{self.name}:{key}", self.rate, self.count)
+        except Exception:
+            # Общий backend недоступен: пропускаем, лимит конкурентности все равно защищает пул
+            RATE_LIMIT_DECISIONS.inc((self.name, "error"))
+            return 0.0
+        RATE_LIMIT_DECISIONS.inc((self.name, "limited" if retry_after else "allowed"))
+        return retry_after
+
+
+class ConcurrencyLimiter:
+    """Не больше limit одновременных запросов группы маршрутов на воркер.
+    Лишние не ждут в очереди, а сразу получают отказ - до того, как займут соединение БД"""
+
+    def __init__(self, name: str, limit: int, saturated: Optional[Callable[[], bool]] = None):
+        self.name = name
+        self.limit = limit
+        self.saturated = saturated
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit or (self.saturated is not None and self.saturated()):
+            CONCURRENCY_DECISIONS.inc((self.name, "shed"))
+            return False
+        self.in_flight += 1
+        CONCURRENCY_DECISIONS.inc((self.name, "admitted"))
+        CONCURRENCY_IN_FLIGHT.set((self.name,), self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        CONCURRENCY_IN_FLIGHT.set((self.name,), self.in_flight)
+
+
+async def admit(rate_limiter: RateLimiter, key: str, concurrency_limiter: ConcurrencyLimiter):
+    """Проверка перед обработчиком: RateLimited, Overloaded или занятый слот (release делает вызывающий)"""
+    retry_after = await rate_limiter.hit(key)
+    if retry_after:
+        raise RateLimited(retry_after)
+    if not concurrency_limiter.try_acquire():
+        raise Overloaded()
+    return concurrency_limiter
+
+
+bucket_backend = make_bucket_backend()
+
+# Ключ - IP для login/register, пользователь для остальных
+rate_limiters = {
+    name: RateLimiter(name, os.getenv(f"RATE_LIMIT_{name.upper()}", default), bucket_backend)
+    for name, default in (
+        ("login", "10/60"),
+        ("register", "5/600"),
+        ("messages", "30/60"),
+        ("tests", "20/60"),
+    )
+}
+
+# Сумма лимитов меньше DB_POOL_SIZE + DB_MAX_OVERFLOW (5 + 10): чтениям всегда остаются соединения.
+# auth ограничен сильнее: каждый запрос занимает поток пула хэширования паролей
+concurrency_limiters = {
+    name: ConcurrencyLimiter(name, int(os.getenv(f"CONCURRENCY_LIMIT_{name.upper()}", default)), pool_exhausted)
+    for name, default in (
+        ("auth", "4"),
+        ("writes", "6"),
+    )
+}
+
+
+def stats() -> dict:
+    return {
+        "enabled": RATE_LIMIT_ENABLED,
+        "backend": type(bucket_backend).__name__,
+        "keys": bucket_backend.size(),
+        "rates": {name: f"{limiter.count}/{limiter.period:g}" for name, limiter in rate_limiters.items()},
+        "concurrency": {
+            name: {"in_flight": limiter.in_flight, "limit": limiter.limit}
+            for name, limiter in concurrency_limiters.items()
+        },
+    }
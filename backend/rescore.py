@@ -0,0 +1,310 @@
+"""
+Пересчет сохраненных результатов тестов после изменения модели подсчета.
+
+Запуск из каталога backend (DATABASE_URL как у приложения, иначе SQLite ./test.db):
+    python rescore.py                        # test_results, затем shared_test_results
+    python rescore.py --workers 8 --chunk-size 20000
+    python rescore.py --only shared          # только совместимость пар
+    python rescore.py --dry-run              # посчитать, сколько строк изменится
+
+Прогресс сохраняется в checkpoint файл после каждой записанной пачки, повторный
+запуск с теми же фазами продолжает с места остановки (--reset начинает заново).
+После прохода всех запрошенных фаз checkpoint удаляется.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from sqlalchemy import select, update, bindparam, func, text
+
+from database import engine
+from models import TestVersion, TestSession, TestResult, SharedTestResult, CoupleStats
+from catalog import test_catalog
+from scoring import get_scorer
+
+PHASES = ("results", "shared")
+DEFAULT_CHECKPOINT = "rescore.checkpoint.json"
+
+# Обновляемые колонки и их типы для временной таблицы COPY (Postgres)
+UPDATE_COLUMNS = {
+    "results": (TestResult.__table__, (("score", "integer"), ("interpretation", "text"))),
+    "shared": (SharedTestResult.__table__, (
+        ("combined_score", "integer"),
+        ("compatibility_percentage", "integer"),
+        ("insights", "json"),
+    )),
+}
+
+
+# ==================== Подсчет (в дочерних процессах) ====================
+
+def rescore_results(versions: dict, rows: list) -> list:
+    """rows: (id, version_id, answers, score, interpretation) -> измененные строки"""
+    changed = []
+    rows = sorted(rows, key=lambda row: row[1])
+    for version_id, group in groupby(rows, key=lambda row: row[1]):
+        group = list(group)
+        scorer = get_scorer(*versions[version_id])
+        scores, interpretations = scorer.score(scorer.encode([row[2] or [] for row in group], strict=False))
+        for row, score, interpretation in zip(group, scores.tolist(), interpretations):
+            if (score, interpretation) != (row[3], row[4]):
+                changed.append({"row_id": row[0], "score": score, "interpretation": interpretation})
+    return changed
+
+
+def rescore_shared(versions: dict, rows: list) -> list:
+    """rows: (id, version_id, combined, compatibility, insights, [(answers, score), ...]) -> измененные строки.
+    В списке результатов - последний результат каждого партнера, по возрастанию completed_at"""
+    changed = []
+    for row_id, version_id, combined, compatibility, insights, results in rows:
+        if len(results) < 2:
+            # Тест прошел только один из партнеров (возможно, несколько раз)
+            continue
+        scorer = get_scorer(*versions[version_id])
+        # Как в submit_test: user1 - прошедший тест последним, user2 - его партнер
+        (answers_b, score_b), (answers_a, score_a) = results[-2:]
+        shared = scorer.shared_result(answers_a or [], answers_b or [], score_a, score_b)
+        if (shared["combined_score"], shared["compatibility_percentage"], shared["insights"]) != \
+                (combined, compatibility, insights):
+            changed.append({"row_id": row_id, **shared})
+    return changed
+
+
+# ==================== Чтение и запись ====================
+
+def load_versions() -> dict:
+    """Все версии тестов: id -> (content_hash, questions, scoring из каталога)"""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(TestVersion.id, TestVersion.catalog_id, TestVersion.content_hash, TestVersion.questions)
+        ).all()
+    return {
+        row.id: (row.content_hash, row.questions, test_catalog.scoring_for(row.catalog_id, row.content_hash))
+        for row in rows
+    }
+
+
+def phase_query(phase: str):
+    if phase == "results":
+        return (
+            select(TestResult.id, TestSession.test_version_id, TestResult.answers,
+                   TestResult.score, TestResult.interpretation)
+            .join(TestSession, TestResult.test_id == TestSession.id),
+            TestResult.id
+        )
+    return (
+        select(SharedTestResult.id, TestSession.test_version_id, SharedTestResult.test_id,
+               SharedTestResult.combined_score, SharedTestResult.compatibility_percentage,
+               SharedTestResult.insights)
+        .join(TestSession, SharedTestResult.test_id == TestSession.id),
+        SharedTestResult.id
+    )
+
+
+def iter_chunks(phase: str, last_id: int, chunk_size: int):
+    """Пачки строк по возрастанию id, начиная после last_id"""
+    query, id_column = phase_query(phase)
+    query = query.where(id_column > last_id).order_by(id_column)
+    if engine.dialect.name == "postgresql":
+        # Серверный курсор: строки приходят пачками, а не все сразу в память
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(query)
+            for rows in result.partitions(chunk_size):
+                yield [tuple(row) for row in rows]
+        return
+    # SQLite: открытый курсор держит блокировку чтения и мешает записи, поэтому keyset по id
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(query.where(id_column > last_id).limit(chunk_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row) for row in rows]
+
+
+def attach_partner_results(conn, rows: list) -> list:
+    """Добавляет к строкам shared_test_results ответы и баллы обоих партнеров"""
+    test_ids = {row[2] for row in rows}
+    # Как в submit_test: последний результат каждого пользователя, а не два последних результата
+    # (партнер мог пройти тест дважды)
+    latest = (
+        select(
+            TestResult.test_id, TestResult.answers, TestResult.score, TestResult.completed_at, TestResult.id,
+            func.row_number().over(
+                partition_by=(TestResult.test_id, TestResult.user_id),
+                order_by=(TestResult.completed_at.desc(), TestResult.id.desc())
+            ).label("position")
+        )
+        .where(TestResult.test_id.in_(test_ids))
+        .subquery()
+    )
+    results = conn.execute(
+        select(latest.c.test_id, latest.c.answers, latest.c.score)
+        .where(latest.c.position == 1)
+        .order_by(latest.c.test_id, latest.c.completed_at, latest.c.id)
+    ).all()
+    by_test = {
+        test_id: [(answers, score) for _, answers, score in group]
+        for test_id, group in groupby(results, key=lambda r: r.test_id)
+    }
+    return [
+        (row_id, version_id, combined, compatibility, insights, by_test.get(test_id, []))
+        for row_id, version_id, test_id, combined, compatibility, insights in rows
+    ]
+
+
+def write_updates(conn, phase: str, updates: list):
+    table, columns = UPDATE_COLUMNS[phase]
+    names = [name for name, _ in columns]
+    if conn.dialect.name == "postgresql":
+        # COPY во временную таблицу + один UPDATE ... FROM
+        conn.execute(text(
+            "CREATE TEMP TABLE rescore_updates (row_id integer, "
+            + ", ".join(f"{name} {column_type}" for name, column_type in columns)
+            + ") ON COMMIT DROP"
+        ))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for item in updates:
+            writer.writerow([item["row_id"]] + [
+                json.dumps(item[name], ensure_ascii=False) if isinstance(item[name], dict) else item[name]
+                for name in names
+            ])
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        cursor.copy_expert(f"COPY rescore_updates (row_id, {', '.join(names)}) FROM STDIN WITH CSV", buffer)
+        conn.execute(text(
+            f"UPDATE {table.name} t SET " + ", ".join(f"{name} = u.{name}" for name in names)
+            + " FROM rescore_updates u WHERE t.id = u.row_id"
+        ))
+        return
+    conn.execute(
+        update(table).where(table.c.id == bindparam("row_id")).values({name: bindparam(name) for name in names}),
+        updates
+    )
+
+
+def refresh_couple_compatibility(conn):
+    """couple_stats.compatibility_total после пересчета совместимости"""
+    conn.execute(
+        update(CoupleStats).values(compatibility_total=(
+            select(func.coalesce(func.sum(SharedTestResult.compatibility_percentage), 0))
+            .where(SharedTestResult.couple_id == CoupleStats.couple_id)
+            .scalar_subquery()
+        ))
+    )
+
+
+# ==================== Checkpoint ====================
+
+def read_checkpoint(path: str, phases: list) -> dict:
+    """Место остановки прошлого запуска с тем же набором фаз, иначе начало первой фазы"""
+    start = {"phases": phases, "phase": phases[0], "last_id": 0}
+    if not os.path.exists(path):
+        return start
+    with open(path) as f:
+        checkpoint = json.load(f)
+    # Checkpoint от запуска с другим --only не продолжаем: иначе полный прогон пропустил бы фазы
+    if checkpoint.get("phases") != phases or checkpoint.get("phase") not in phases:
+        print(f"⚠️ {path} записан для фаз {checkpoint.get('phases')}, начинаем заново")
+        return start
+    return checkpoint
+
+
+def write_checkpoint(path: str, phases: list, phase: str, last_id: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"phases": phases, "phase": phase, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+
+# ==================== Запуск ====================
+
+def run_phase(phase: str, last_id: int, versions: dict, executor, args, requested: list):
+    scorer_task = rescore_results if phase == "results" else rescore_shared
+    started = time.perf_counter()
+    scanned = changed = 0
+    pending = []
+
+    def flush(future, chunk_last_id, rows_count):
+        nonlocal scanned, changed
+        updates = future.result() if executor else future
+        if updates and not args.dry_run:
+            with engine.begin() as conn:
+                write_updates(conn, phase, updates)
+        if not args.dry_run:
+            write_checkpoint(args.checkpoint, requested, phase, chunk_last_id)
+        scanned += rows_count
+        changed += len(updates)
+        elapsed = time.perf_counter() - started
+        print(f"  {phase}: {scanned} строк, изменено {changed}, до id {chunk_last_id}, "
+              f"{scanned / elapsed if elapsed else 0:,.0f} строк/с")
+
+    for rows in iter_chunks(phase, last_id, args.chunk_size):
+        if phase == "shared":
+            with engine.connect() as conn:
+                rows = attach_partner_results(conn, rows)
+        needed = {row[1]: versions[row[1]] for row in rows}
+        if executor:
+            pending.append((executor.submit(scorer_task, needed, rows), rows[-1][0], len(rows)))
+            # Не больше двух пачек на воркер в очереди; запись строго по порядку id для checkpoint
+            while len(pending) >= args.workers * 2:
+                flush(*pending.pop(0))
+        else:
+            flush(scorer_task(needed, rows), rows[-1][0], len(rows))
+    for item in pending:
+        flush(*item)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {phase}: {scanned} строк за {elapsed:.1f} с, изменено {changed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="процессов для подсчета (0 - в текущем процессе)")
+    parser.add_argument("--only", choices=PHASES)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--reset", action="store_true", help="игнорировать сохраненный checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="ничего не записывать")
+    args = parser.parse_args()
+
+    test_catalog.load()
+    versions = load_versions()
+    requested = [args.only] if args.only else list(PHASES)
+    if args.reset:
+        checkpoint = {"phases": requested, "phase": requested[0], "last_id": 0}
+    else:
+        checkpoint = read_checkpoint(args.checkpoint, requested)
+    phases = requested[requested.index(checkpoint["phase"]):]
+    print(f"Пересчет {', '.join(phases)} ({engine.dialect.name}), продолжение после id {checkpoint['last_id']}")
+
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 0 else None
+    try:
+        for phase in phases:
+            last_id = checkpoint["last_id"] if phase == checkpoint["phase"] else 0
+            run_phase(phase, last_id, versions, executor, args, requested)
+            if not args.dry_run and phase != requested[-1]:
+                write_checkpoint(args.checkpoint, requested, requested[requested.index(phase) + 1], 0)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if not args.dry_run:
+        if "shared" in phases:
+            with engine.begin() as conn:
+                refresh_couple_compatibility(conn)
+            print("✅ couple_stats.compatibility_total обновлен")
+        # Все запрошенные фазы пройдены: следующий запуск начинает с начала
+        if os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
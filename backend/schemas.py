@@ -104,7 +104,13 @@ class LoveMessageResponse(BaseModel):
 # Токены
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int  # Секунды жизни access токена
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -0,0 +1,210 @@
+# scoring.py
+from __future__ import annotations
+
+import json
+from typing import Optional
+
+# Модели подсчета, которые можно указать в поле "scoring" теста каталога
+MODELS = ("sum", "weighted", "categorical")
+COMPATIBILITY_MODES = ("score", "cosine")
+
+# Поведение для тестов без "scoring" (как было раньше в submit_test)
+DEFAULT_SCORING = {
+    "model": "sum",
+    "interpretations": [
+        {"below": 3, "text": "Есть над чем поработать"},
+        {"below": 6, "text": "Хороший результат"},
+        {"text": "Отличная совместимость!"},
+    ],
+    "compatibility": "score",
+}
+SIMILAR_TEXT = "Ваши результаты хорошо дополняют друг друга"
+DIFFERENT_TEXT = "Есть различия в подходах"
+NO_ANSWERS_TEXT = "Недостаточно ответов"
+MAX_CACHED_SCORERS = 256
+
+_scorers = {}
+
+
+class ScoringError(Exception):
+    pass
+
+
+# NumPy (~50 мс импорта) загружается при первом подсчете, а не при import main
+np = None
+
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def option_points(value) -> float:
+    # Числовые варианты дают свое значение, остальные - 1 балл
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return 1.0
+
+
+class Scorer:
+    """Подсчет результатов одного теста матричными операциями NumPy.
+
+    Ответы кодируются в one-hot матрицу (прохождения x варианты ответов), поэтому
+    одно прохождение и тысячи прохождений считаются одним и тем же кодом.
+    """
+
+    def __init__(self, questions: list, spec: Optional[dict] = None, compile: bool = True):
+        """compile=False - только проверка определения (каталог при старте), без NumPy"""
+        spec = spec or DEFAULT_SCORING
+        self.model = spec.get("model", "sum")
+        self.compatibility_mode = spec.get("compatibility", "score")
+        if self.model not in MODELS:
+            raise ScoringError(f"Неизвестная модель подсчета: {self.model}")
+        if self.compatibility_mode not in COMPATIBILITY_MODES:
+            raise ScoringError(f"Неизвестный способ совместимости: {self.compatibility_mode}")
+
+        weights = spec.get("weights", {}) if self.model == "weighted" else {}
+        self.columns = {}
+        points = []
+        categories = []
+        question_max = []
+        for question in questions:
+            weight = float(weights.get(str(question["id"]), 1))
+            options = [option_points(option.get("points", option["value"])) * weight
+                       for option in question["options"]]
+            for option, value in zip(question["options"], options):
+                self.columns[(question["id"], option["value"])] = len(points)
+                points.append(value)
+                categories.append(option.get("category", option["value"]))
+            question_max.append(max(options, default=0.0))
+        self.points = points
+        self.max_score = float(spec.get("max_score") or sum(question_max)) or 1.0
+        self.similar_within = spec.get("similar_within", 2)
+
+        if self.model == "categorical":
+            self.categories = list(dict.fromkeys(categories))
+            labels = spec.get("categories", {})
+            self.category_labels = [labels.get(str(c), str(c)) for c in self.categories]
+            self.category_columns = [self.categories.index(c) for c in categories]
+            self.template = spec.get("interpretation", "{category}")
+        else:
+            bounds = spec.get("interpretations", DEFAULT_SCORING["interpretations"])
+            self.bounds = [float(b["below"]) for b in bounds if "below" in b]
+            self.texts = [b["text"] for b in bounds]
+            if len(self.texts) != len(self.bounds) + 1:
+                raise ScoringError("Последняя интерпретация должна быть без границы below")
+
+        if compile:
+            self.compile()
+
+    def compile(self):
+        """Массивы NumPy для матричного подсчета"""
+        np = load_numpy()
+        self.points = np.array(self.points, dtype=np.float64)
+        if self.model == "categorical":
+            self.category_matrix = np.zeros((len(self.points), len(self.categories)), dtype=np.float64)
+            self.category_matrix[np.arange(len(self.points)), self.category_columns] = 1
+        else:
+            self.bounds = np.array(self.bounds, dtype=np.float64)
+
+    def encode(self, submissions: list, strict: bool = True) -> np.ndarray:
+        """Список прохождений (каждое - список ответов {question_id, answer_value}) -> one-hot матрица.
+
+        strict=False пропускает неизвестные ответы (старые строки test_results).
+        """
+        rows, cols = [], []
+        for row, answers in enumerate(submissions):
+            for answer in answers:
+                key = (answer.get("question_id"), answer.get("answer_value"))
+                try:
+                    col = self.columns[key]
+                except (KeyError, TypeError):
+                    if not strict:
+                        continue
+                    raise ScoringError(f"Некорректный ответ на вопрос {answer.get('question_id')}")
+                rows.append(row)
+                cols.append(col)
+        matrix = np.zeros((len(submissions), len(self.points)), dtype=np.float64)
+        # Повторный ответ на тот же вариант не удваивает баллы
+        matrix[rows, cols] = 1
+        return matrix
+
+    def vectors(self, matrix: np.ndarray) -> np.ndarray:
+        """Векторы ответов для косинусной близости партнеров"""
+        if self.model == "categorical":
+            return matrix @ self.category_matrix
+        return matrix
+
+    def score(self, matrix: np.ndarray):
+        """Баллы (int) и интерпретации для каждой строки матрицы"""
+        if self.model == "categorical":
+            distribution = matrix @ self.category_matrix
+            scores = distribution.max(axis=1, initial=0)
+            dominant = distribution.argmax(axis=1) if distribution.shape[1] else np.zeros(len(matrix), dtype=int)
+            interpretations = [
+                self.template.format(category=self.category_labels[index]) if total else NO_ANSWERS_TEXT
+                for index, total in zip(dominant.tolist(), distribution.sum(axis=1).tolist())
+            ]
+            return scores.astype(np.int64), interpretations
+
+        scores = np.rint(matrix @ self.points).astype(np.int64)
+        indexes = np.searchsorted(self.bounds, scores, side="right")
+        return scores, [self.texts[index] for index in indexes.tolist()]
+
+    def compatibility(self, matrix_a: np.ndarray, matrix_b: np.ndarray, scores_a: np.ndarray,
+                      scores_b: np.ndarray):
+        """Общий балл и процент совместимости для пар строк двух матриц"""
+        combined = (scores_a + scores_b) / 2
+        if self.compatibility_mode == "cosine":
+            a = self.vectors(matrix_a)
+            b = self.vectors(matrix_b)
+            norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+            dots = (a * b).sum(axis=1)
+            similarity = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+            percentage = np.rint(similarity * 100)
+        else:
+            percentage = np.floor(combined / self.max_score * 100)
+        return combined.astype(np.int64), np.clip(percentage, 0, 100).astype(np.int64)
+
+    def is_similar(self, score_a: int, score_b: int, compatibility: int) -> bool:
+        if self.compatibility_mode == "cosine":
+            return compatibility >= 50
+        return abs(score_a - score_b) <= self.similar_within
+
+    def score_one(self, answers: list):
+        """Баллы и интерпретация одного прохождения"""
+        scores, interpretations = self.score(self.encode([answers]))
+        return int(scores[0]), interpretations[0]
+
+    def shared_result(self, answers_a: list, answers_b: list, score_a: int, score_b: int) -> dict:
+        """Поля SharedTestResult для двух прохождений пары"""
+        combined, percentage = self.compatibility(
+            self.encode([answers_a], strict=False),
+            self.encode([answers_b], strict=False),
+            np.array([score_a]),
+            np.array([score_b])
+        )
+        compatibility = int(percentage[0])
+        return {
+            "combined_score": int(combined[0]),
+            "compatibility_percentage": compatibility,
+            "insights": {
+                "user1_score": score_a,
+                "user2_score": score_b,
+                "comparison": SIMILAR_TEXT if self.is_similar(score_a, score_b, compatibility) else DIFFERENT_TEXT
+            }
+        }
+
+
+def get_scorer(version_hash: str, questions: list, spec: Optional[dict] = None) -> Scorer:
+    """Скомпилированный Scorer для версии теста; пересобирается, если в каталоге поменялся scoring"""
+    key = (version_hash, json.dumps(spec, sort_keys=True))
+    scorer = _scorers.get(key)
+    if scorer is None:
+        if len(_scorers) >= MAX_CACHED_SCORERS:
+            _scorers.clear()
+        scorer = _scorers[key] = Scorer(questions, spec)
+    return scorer
@@ -0,0 +1,77 @@
+# serialization.py
+import os
+import json
+from operator import attrgetter
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from schemas import UserResponse, CoupleResponse, Token
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Быстрый путь: orjson вместо jsonable_encoder + json.dumps; FAST_JSON=false - прежнее поведение
+FAST_JSON = os.getenv("FAST_JSON", "true").lower() == "true" and orjson is not None
+
+
+def dumps(content: Any) -> bytes:
+    if FAST_JSON:
+        # datetime, date и UUID orjson сериализует сам (в том же ISO формате)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с рендером через orjson (default_response_class приложения)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200, headers: dict = None) -> Response:
+    """Ответ из обработчика как есть: FastAPI не прогоняет его через jsonable_encoder"""
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+class Serializer:
+    """Сериализатор схемы ответа, собранный один раз: поля читаются attrgetter без валидации.
+    Только для доверенных данных (ORM объекты и словари из обработчиков)"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = tuple(schema.model_fields)
+        self._get = attrgetter(*self.fields)
+
+    def to_dict(self, obj) -> dict:
+        if isinstance(obj, dict):
+            return {field: obj[field] for field in self.fields}
+        values = self._get(obj)
+        if len(self.fields) == 1:
+            values = (values,)
+        return dict(zip(self.fields, values))
+
+    def render(self, obj) -> bytes:
+        return dumps(self.to_dict(obj))
+
+    def response(self, obj, status_code: int = 200, headers: dict = None) -> Response:
+        if not FAST_JSON:
+            # Прежний путь: валидация response_model и jsonable_encoder
+            return JSONResponse(
+                jsonable_encoder(self.schema.model_validate(obj)), status_code=status_code, headers=headers
+            )
+        return json_response(self.to_dict(obj), status_code=status_code, headers=headers)
+
+
+user_serializer = Serializer(UserResponse)
+couple_serializer = Serializer(CoupleResponse)
+token_serializer = Serializer(Token)
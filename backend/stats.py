@@ -0,0 +1,74 @@
+# stats.py
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import CoupleStats, UserStats, TestResult, SharedTestResult, LoveMessage
+
+
+async def compute_couple_stats(db: AsyncSession, couple_id: int) -> CoupleStats:
+    """Пересчет счетчиков пары по исходным таблицам (для пар без строки couple_stats)"""
+    message_count = await db.scalar(
+        select(func.count()).select_from(LoveMessage).where(LoveMessage.couple_id == couple_id)
+    )
+    shared_count, compatibility_total = (await db.execute(
+        select(func.count(), func.coalesce(func.sum(SharedTestResult.compatibility_percentage), 0))
+        .where(SharedTestResult.couple_id == couple_id)
+    )).one()
+    return CoupleStats(
+        couple_id=couple_id,
+        message_count=message_count,
+        shared_test_count=shared_count,
+        compatibility_total=compatibility_total
+    )
+
+
+async def compute_user_stats(db: AsyncSession, user_id: int) -> UserStats:
+    """Пересчет счетчиков пользователя по исходным таблицам"""
+    test_count = await db.scalar(
+        select(func.count()).select_from(TestResult).where(TestResult.user_id == user_id)
+    )
+    return UserStats(user_id=user_id, test_count=test_count)
+
+
+async def insert_missing(db: AsyncSession, row) -> bool:
+    """INSERT ... ON CONFLICT DO NOTHING строки счетчиков; False - ее уже вставила другая транзакция"""
+    insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    table = type(row).__table__
+    values = {column.name: getattr(row, column.name) for column in table.columns if column.name != "updated_at"}
+    result = await db.execute(insert(table).values(**values).on_conflict_do_nothing())
+    return result.rowcount == 1
+
+
+async def bump_couple_stats(db: AsyncSession, couple_id: int, messages: int = 0,
+                            shared_tests: int = 0, compatibility: int = 0):
+    """Инкремент счетчиков пары в текущей транзакции (вызывать до commit)"""
+    statement = (
+        update(CoupleStats)
+        .where(CoupleStats.couple_id == couple_id)
+        .values(
+            message_count=CoupleStats.message_count + messages,
+            shared_test_count=CoupleStats.shared_test_count + shared_tests,
+            compatibility_total=CoupleStats.compatibility_total + compatibility
+        )
+    )
+    if (await db.execute(statement)).rowcount == 0:
+        # Строки еще нет (новая пара) - считаем по таблицам: новая запись уже flush'нута и попадет в подсчет.
+        # Если строку параллельно вставил другой запрос, он нашу запись не видел - добавляем инкремент
+        await db.flush()
+        if not await insert_missing(db, await compute_couple_stats(db, couple_id)):
+            await db.execute(statement)
+
+
+async def bump_user_stats(db: AsyncSession, user_id: int, tests: int = 0):
+    """Инкремент счетчиков пользователя в текущей транзакции (вызывать до commit)"""
+    statement = (
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(test_count=UserStats.test_count + tests)
+    )
+    if (await db.execute(statement)).rowcount == 0:
+        await db.flush()
+        if not await insert_missing(db, await compute_user_stats(db, user_id)):
+            await db.execute(statement)
@@ -0,0 +1,179 @@
+# tokens.py
+import os
+import time
+import uuid
+import hashlib
+import secrets
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from jose import JWTError, jwt
+from sqlalchemy import select, update
+
+from models import RefreshToken
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+ALGORITHM = "HS256"
+# Короткие access токены (claims без запроса к БД) + долгие refresh токены с ротацией
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Сколько уже проверенных access токенов помнить (повторный запрос с тем же токеном без HMAC и JSON)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class TokenClaims(NamedTuple):
+    """То, что обработчикам нужно из access токена"""
+    user_id: int
+    couple_id: Optional[int]
+    jti: str
+    expires_at: float  # unix time
+
+
+# Проверенные токены: токен целиком -> claims (подпись покрывает header и payload)
+_verified = OrderedDict()
+# Отозванные access токены: jti -> expires_at; хранятся только до истечения токена
+_revoked = {}
+cache_hits = 0
+cache_misses = 0
+cache_evictions = 0
+
+
+def create_access_token(user_id: int, couple_id: Optional[int]) -> str:
+    now = int(time.time())
+    payload = {
+        "sub": str(user_id),
+        "cid": couple_id,
+        "typ": "access",
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_access_token(token: str) -> TokenClaims:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Токены до появления refresh: только sub и exp
+        if payload.get("typ", "access") != "access":
+            raise InvalidToken()
+        return TokenClaims(
+            user_id=int(payload["sub"]),
+            couple_id=payload.get("cid"),
+            jti=payload.get("jti", ""),
+            expires_at=float(payload["exp"]),
+        )
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise InvalidToken()
+
+
+def verify_access_token(token: str) -> TokenClaims:
+    """Claims access токена; подпись проверяется один раз на токен, дальше - LRU"""
+    global cache_hits, cache_misses, cache_evictions
+    claims = _verified.get(token)
+    if claims is None:
+        cache_misses += 1
+        claims = decode_access_token(token)
+        _verified[token] = claims
+        if len(_verified) > TOKEN_CACHE_SIZE:
+            _verified.popitem(last=False)
+            cache_evictions += 1
+    else:
+        cache_hits += 1
+        _verified.move_to_end(token)
+        if claims.expires_at <= time.time():
+            del _verified[token]
+            raise InvalidToken()
+    if claims.jti in _revoked:
+        raise InvalidToken()
+    return claims
+
+
+def revoke_access_token(claims: TokenClaims):
+    """Отзыв до истечения (logout). Список в памяти воркера: остальные воркеры
+    примут токен не дольше ACCESS_TOKEN_EXPIRE_MINUTES, refresh отзывается в БД"""
+    now = time.time()
+    for jti in [jti for jti, expires_at in _revoked.items() if expires_at <= now]:
+        del _revoked[jti]
+    if claims.jti:
+        _revoked[claims.jti] = claims.expires_at
+
+
+def stats() -> dict:
+    total = cache_hits + cache_misses
+    # Те же ключи, что ObjectCache.stats (кэш проверенных токенов)
+    return {
+        "backend": "MemoryBackend",
+        "hits": cache_hits,
+        "misses": cache_misses,
+        "hit_rate": round(cache_hits / total, 3) if total else 0.0,
+        "evictions": cache_evictions,
+        "size": len(_verified),
+        "revoked": len(_revoked),
+    }
+
+
+# ==================== Refresh токены ====================
+
+def hash_refresh_token(token: str) -> str:
+    # В БД только sha256: утечка таблицы не дает рабочих токенов
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(db, user_id: int, family: Optional[str] = None) -> str:
+    """Новый refresh токен (строка добавляется в сессию, commit делает вызывающий)"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    db.add(RefreshToken(
+        user_id=user_id,
+        family=family or uuid.uuid4().hex,
+        token_hash=hash_refresh_token(token),
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def rotate_refresh_token(db, token: str) -> tuple:
+    """(user_id, новый refresh токен); старый токен одноразовый.
+    Повторное использование старого токена (украден или перехвачен) отзывает всю цепочку."""
+    row = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token)))
+    now = datetime.utcnow()
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        raise InvalidToken()
+
+    # Условный UPDATE: из двух одновременных ротаций одного токена проходит только одна
+    used = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    )
+    if used.rowcount != 1:
+        await revoke_refresh_family(db, row.family)
+        await db.commit()
+        raise InvalidToken()
+
+    return row.user_id, issue_refresh_token(db, row.user_id, family=row.family)
+
+
+async def revoke_refresh_family(db, family: str):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
+async def revoke_refresh_token(db, token: str, user_id: int):
+    """Logout: отзывает цепочку токена, если он принадлежит пользователю"""
+    family = await db.scalar(
+        select(RefreshToken.family)
+        .where(RefreshToken.token_hash == hash_refresh_token(token), RefreshToken.user_id == user_id)
+    )
+    if family is not None:
+        await revoke_refresh_family(db, family)
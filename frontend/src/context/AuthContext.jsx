@@ -7,20 +7,29 @@ export const useAuth = () => useContext(AuthContext);
 
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
+  const [dashboard, setDashboard] = useState(null);
   const [loading, setLoading] = useState(true);
 
+  // Профиль и данные главной страницы одним запросом (вместо /profile, /stats, /couples/my)
+  const loadDashboard = async () => {
+    const response = await api.get('/dashboard');
+    setUser(response.data.profile);
+    setDashboard({ ...response.data, loadedAt: Date.now() });
+    return response.data;
+  };
+
 useEffect(() => {
   const initAuth = async () => {
     const token = localStorage.getItem('token');
 
     if (token) {
       try {
-        // Проверяем токен и получаем пользователя
-        const response = await api.get('/profile');
-        setUser(response.data);
+        // Проверяем токен и получаем пользователя вместе с данными dashboard
+        await loadDashboard();
       } catch (error) {
         console.error('Auth check failed:', error);
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         setUser(null);
       }
@@ -53,12 +62,12 @@ const login = async (email, password) => {
       password
     });
 
-    const { access_token } = response.data;
+    const { access_token, refresh_token } = response.data;
     localStorage.setItem('token', access_token);
+    localStorage.setItem('refresh_token', refresh_token);
 
-    // 2. Получаем данные пользователя с сервера
-    const userResponse = await api.get('/profile');
-    const userData = userResponse.data;
+    // 2. Получаем данные пользователя с сервера (вместе с данными dashboard)
+    const { profile: userData } = await loadDashboard();
 
     // 3. Сохраняем пользователя в localStorage и состоянии
     localStorage.setItem('user', JSON.stringify(userData));
@@ -78,7 +87,14 @@ const login = async (email, password) => {
   };
 
   const logout = () => {
+    // Отзываем refresh токен на сервере; выход не ждет ответа
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      api.post('/logout', { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    setDashboard(null);
     delete api.defaults.headers.common['Authorization'];
     setUser(null);
   };
@@ -90,6 +106,8 @@ const login = async (email, password) => {
   return (
     <AuthContext.Provider value={{
       user,
+      dashboard,
+      loadDashboard,
       loading,
       login,
       register,
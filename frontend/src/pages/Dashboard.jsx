@@ -5,31 +5,32 @@ import { useAuth } from '../context/AuthContext';
 import api from '../services/api';
 import toast from 'react-hot-toast';
 
+// Данные, загруженные при входе, используются для первого отображения без повторного запроса
+const DASHBOARD_MAX_AGE_MS = 5000;
+
 const Dashboard = () => {
-  const { user } = useAuth();
+  const { user, dashboard, loadDashboard } = useAuth();
   const navigate = useNavigate();
-  const [stats, setStats] = useState(null);
-  const [couple, setCouple] = useState(null);
   const [showCoupleModal, setShowCoupleModal] = useState(false);
   const [coupleCode, setCoupleCode] = useState('');
 
+  // Данные приходят из /dashboard вместе с профилем (AuthContext), отдельные запросы не нужны
+  const stats = dashboard?.stats;
+  const couple = dashboard?.couple;
+  const messages = dashboard?.messages || [];
+  const pendingTests = dashboard?.pending_tests || [];
+
   useEffect(() => {
-    loadData();
+    if (!dashboard || Date.now() - dashboard.loadedAt > DASHBOARD_MAX_AGE_MS) {
+      loadData();
+    }
   }, []);
 
   const loadData = async () => {
     try {
-      // Загружаем статистику
-      const statsRes = await api.get('/stats');
-      setStats(statsRes.data);
-
-      // Загружаем информацию о паре
-      const coupleRes = await api.get('/couples/my');
-      setCouple(coupleRes.data);
+      await loadDashboard();
     } catch (error) {
-      if (error.response?.status === 404) {
-        // Пара не найдена - это нормально для нового пользователя
-      }
+      console.error('Failed to load dashboard:', error);
     }
   };
 
@@ -206,6 +207,30 @@ const Dashboard = () => {
         <div className="bg-white rounded-xl p-6 shadow-lg">
           <h2 className="text-xl font-bold mb-4">Последняя активность</h2>
           <div className="space-y-4">
+            {pendingTests.map(test => (
+              <button
+                key={`test-${test.test_id}`}
+                onClick={() => navigate('/tests')}
+                className="w-full flex items-center p-4 bg-pink-50 rounded-lg text-left"
+              >
+                <BarChart3 className="w-6 h-6 text-pink-500 mr-4" />
+                <div>
+                  <p className="font-medium">{test.title}</p>
+                  <p className="text-sm text-gray-500">
+                    {test.partner_completed ? 'Партнер уже ответил - ваша очередь' : 'Ожидает ваших ответов'}
+                  </p>
+                </div>
+              </button>
+            ))}
+            {messages.map(message => (
+              <div key={`message-${message.id}`} className="flex items-center p-4 bg-gray-50 rounded-lg">
+                <MessageSquare className="w-6 h-6 text-blue-400 mr-4" />
+                <div>
+                  <p className="font-medium">{message.is_yours ? 'Вы' : message.username}</p>
+                  <p className="text-sm text-gray-500">{message.message}</p>
+                </div>
+              </div>
+            ))}
             {couple && couple.partners?.map(partner => (
               <div key={partner.id} className="flex items-center p-4 bg-gray-50 rounded-lg">
                 <div className="w-10 h-10 rounded-full bg-pink-500 flex items-center justify-center text-white mr-4">
@@ -26,12 +26,47 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Один запрос обновления на все запросы, получившие 401 одновременно
+// (refresh токен одноразовый: повторное использование отзывает вход)
+let refreshPromise = null;
+
+const refreshTokens = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    refreshPromise = axios
+      .post(`${getApiBaseUrl()}/token/refresh`, { refresh_token: refreshToken })
+      .then(response => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Обработка ошибок
 api.interceptors.response.use(
   response => response,
-  error => {
+  async error => {
+    const original = error.config;
+    if (error.response?.status === 401 && original && !original._retry && original.url !== '/login'
+        && localStorage.getItem('refresh_token')) {
+      // Access токен истек: получаем новый и повторяем запрос
+      original._retry = true;
+      try {
+        const token = await refreshTokens();
+        original.headers.Authorization = `Bearer ${token}`;
+        return api(original);
+      } catch (refreshError) {
+        // Refresh токен тоже недействителен - нужен вход
+      }
+    }
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       window.location.href = '/login';
     }
     return Promise.reject(error);